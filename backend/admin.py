@@ -1,52 +1,162 @@
-from flask import Blueprint, request, jsonify
-import os
-from datetime import datetime, timedelta
-from db import get_db_cursor
+from flask import Blueprint, Response, request, jsonify
+from datetime import date, datetime, timedelta
+from db import PoolTimeout, get_db_cursor, record_write_lsn
+from catalog import catalog_response, invalidate_catalog, PRODUCT_CURSOR, PRODUCT_FIELDS
+from pagination import parse_page_args, paginate, set_next_cursor
+from serialization import csv_chunks, gzip_chunks, ndjson_chunks, query_batches, stream_query
+from cache import cached_view
+from images import save_upload
+from tokens import require_auth
+from rollups import analytics_cache, invalidate_analytics
+
+USER_FIELDS = ('email', 'password')
+ORDER_FIELDS = ('order_id', 'user_email', 'total_price', 'date')
+# Sort keys: users by email, orders by (date, order_id)
+USER_CURSOR = (str,)
+ORDER_CURSOR = (date, str)
+
+# One row per order line; orders without items get one row with empty line columns
+EXPORT_COLUMNS = ('order_id', 'date', 'email', 'order_total', 'product_id', 'quantity', 'price_at_purchase')
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
 
 admin_bp = Blueprint('admin', __name__)
 
 @admin_bp.route('/users', methods=['GET'])
+@require_auth('admin')
 def get_users():
     try:
+        page = parse_page_args(request.args, USER_FIELDS, USER_CURSOR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if not page.paginated:
+            # Whole table: streamed from a server-side cursor
+            return stream_query("SELECT email, password FROM users ORDER BY email", fields=page.fields)
+
         with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            cursor.execute("SELECT email, password FROM users")
-            users = cursor.fetchall()
-            result = [{'email': row['email'], 'password': row['password']} for row in users]
-            return jsonify(result)
+            after_email = page.after[0] if page.after else ''
+            cursor.execute(
+                "SELECT email, password FROM users WHERE email > %s ORDER BY email LIMIT %s",
+                (after_email, page.limit + 1)
+            )
+            items, next_cursor = paginate(cursor.fetchall(), page, lambda item: [item['email']])
+            return set_next_cursor(jsonify(items), next_cursor)
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
 
 @admin_bp.route('/orders', methods=['GET'])
+@require_auth('admin')
 def get_orders():
     date = request.args.get('date')
-    
+
+    try:
+        page = parse_page_args(request.args, ORDER_FIELDS, ORDER_CURSOR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Newest first; order_id breaks ties within a day so the keyset is stable
+    conditions = []
+    params = []
+    if date:
+        conditions.append("date = %s")
+        params.append(date)
+    if page.after:
+        conditions.append("(date, order_id) < (%s, %s)")
+        params.extend(page.after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = ""
+    if page.paginated:
+        limit = "LIMIT %s"
+        params.append(page.limit + 1)
+
+    sql = f"""SELECT order_id, email as user_email, amount as total_price, date FROM orders
+              {where} ORDER BY date DESC, order_id DESC {limit}"""
+
     try:
+        if not page.paginated:
+            # Every order: streamed from a server-side cursor, Decimal and date encoded as they come
+            return stream_query(sql, tuple(params), fields=page.fields)
+
         with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            if date:
-                cursor.execute(
-                    "SELECT order_id, email as user_email, amount as total_price, date FROM orders WHERE date = %s",
-                    (date,)
-                )
-            else:
-                cursor.execute(
-                    "SELECT order_id, email as user_email, amount as total_price, date FROM orders"
-                )
-            
-            orders = cursor.fetchall()
-            result = []
-            for row in orders:
-                result.append({
-                    'order_id': row['order_id'],
-                    'user_email': row['user_email'],
-                    'total_price': float(row['total_price']),
-                    'date': str(row['date'])
-                })
-            return jsonify(result)
+            cursor.execute(sql, tuple(params))
+            items, next_cursor = paginate(cursor.fetchall(), page, lambda item: [item['date'], item['order_id']])
+            return set_next_cursor(jsonify(items), next_cursor)
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
 
+@admin_bp.route('/orders/export', methods=['GET'])
+@require_auth('admin')
+def export_orders():
+    """Stream orders joined to their line items as CSV or NDJSON.
+
+    Filters: ``from`` / ``to`` (inclusive, YYYY-MM-DD) and ``email``.
+    ``offset`` skips that many rows so an interrupted download can be
+    resumed; rows are in (date, order_id, line) order. The body is gzipped
+    for clients that accept it, unless ``gzip=0``.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+
+    conditions = []
+    params = []
+    try:
+        for arg, operator in (('from', '>='), ('to', '<=')):
+            value = request.args.get(arg)
+            if value:
+                conditions.append(f"o.date {operator} %s")
+                params.append(datetime.strptime(value, '%Y-%m-%d').date())
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD and offset a non-negative integer'}), 400
+    email = request.args.get('email')
+    if email:
+        conditions.append("o.email = %s")
+        params.append(email)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    try:
+        # Served by the replica when there is one; rows are fetched in batches
+        batches = query_batches(
+            f"""SELECT o.order_id, o.date, o.email, o.amount AS order_total,
+                       oi.product_id, oi.quantity, oi.price_at_purchase
+                FROM orders o
+                LEFT JOIN order_items oi ON oi.order_id = o.order_id
+                {where}
+                ORDER BY o.date, o.order_id, oi.id""",
+            tuple(params), offset=offset, readonly=True
+        )
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+    if export_format == 'csv':
+        # A resumed download continues the file, so the header only comes first
+        chunks = csv_chunks(batches, EXPORT_COLUMNS, header=offset == 0)
+    else:
+        chunks = ndjson_chunks(batches)
+
+    headers = {'Content-Disposition': f'attachment; filename="orders.{export_format}"'}
+    if request.accept_encodings['gzip'] and request.args.get('gzip') != '0':
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(chunks, headers=headers, content_type=EXPORT_FORMATS[export_format])
+    response.vary.add('Accept-Encoding')
+    return response
 
 @admin_bp.route('/add-product', methods=['POST'])
+@require_auth('admin')
 def add_product():
     name = request.form.get('name')
     price = request.form.get('price')
@@ -56,10 +166,11 @@ def add_product():
     if not all([name, price, stock, image]):
         return jsonify({'error': 'Missing fields'}), 400
 
-    filename = image.filename
-    image_path = os.path.join('static', 'images', filename)
-    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-    image.save(image_path)
+    try:
+        # Content-hashed name: never overwrites another product's image
+        filename = save_upload(image)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
         with get_db_cursor() as (cursor, conn):
@@ -73,65 +184,75 @@ def add_product():
                 (new_id, name, float(price), int(stock), filename)
             )
             conn.commit()
+            record_write_lsn(conn)
+            invalidate_catalog()
+            invalidate_analytics()
             return jsonify({'message': 'Product added'}), 200
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 @admin_bp.route('/products', methods=['GET'])
+@require_auth('admin')
 def get_products():
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            cursor.execute("SELECT id AS ID, name, price, stock, image FROM products")
-            products = cursor.fetchall()
-            result = []
-            for row in products:
-                result.append({
-                    'ID': int(row['id']),
-                    'name': row['name'],
-                    'price': float(row['price']),
-                    'stock': int(row['stock']),
-                    'image': row['image']
-                })
-            return jsonify(result)
+        page = parse_page_args(request.args, PRODUCT_FIELDS, PRODUCT_CURSOR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if not page.paginated:
+            # Admins get the live table streamed rather than the shopper-facing cached body
+            return stream_query(
+                'SELECT id AS "ID", name, price, stock, image FROM products ORDER BY id',
+                fields=page.fields
+            )
+        return catalog_response(page)
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
 
 @admin_bp.route('/remove-product/<product_id>', methods=['DELETE'])
+@require_auth('admin')
 def remove_product(product_id):
     try:
         with get_db_cursor() as (cursor, conn):
             cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
             conn.commit()
+            record_write_lsn(conn)
+            invalidate_catalog()
+            invalidate_analytics()
             
             if cursor.rowcount > 0:
                 return jsonify({'message': f'Product {product_id} removed'})
             else:
                 return jsonify({'message': f'Product {product_id} not found'}), 404
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 
 # ============= ANALYTICS ENDPOINTS =============
 
 @admin_bp.route('/analytics/revenue', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_revenue_analytics():
     """Get revenue analytics - total, daily, weekly, monthly"""
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             # Total revenue
-            cursor.execute("SELECT COALESCE(SUM(amount), 0) as total FROM orders")
+            cursor.execute("SELECT COALESCE(SUM(revenue), 0) as total FROM daily_sales")
             total_revenue = float(cursor.fetchone()['total'] or 0)
             
             # Revenue per day (last 30 days)
             cursor.execute("""
-                SELECT date, COALESCE(SUM(amount), 0) as revenue
-                FROM orders
+                SELECT date, revenue
+                FROM daily_sales
                 WHERE date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY date
                 ORDER BY date
             """)
             daily_revenue = [{'date': str(row['date']), 'revenue': float(row['revenue'])} for row in cursor.fetchall()]
@@ -140,8 +261,8 @@ def get_revenue_analytics():
             cursor.execute("""
                 SELECT 
                     DATE_TRUNC('week', date)::DATE as week,
-                    COALESCE(SUM(amount), 0) as revenue
-                FROM orders
+                    COALESCE(SUM(revenue), 0) as revenue
+                FROM daily_sales
                 WHERE date >= CURRENT_DATE - INTERVAL '84 days'
                 GROUP BY DATE_TRUNC('week', date)
                 ORDER BY week
@@ -152,8 +273,8 @@ def get_revenue_analytics():
             cursor.execute("""
                 SELECT 
                     DATE_TRUNC('month', date)::DATE as month,
-                    COALESCE(SUM(amount), 0) as revenue
-                FROM orders
+                    COALESCE(SUM(revenue), 0) as revenue
+                FROM daily_sales
                 WHERE date >= CURRENT_DATE - INTERVAL '12 months'
                 GROUP BY DATE_TRUNC('month', date)
                 ORDER BY month
@@ -166,6 +287,8 @@ def get_revenue_analytics():
                 'weekly_revenue': weekly_revenue,
                 'monthly_revenue': monthly_revenue
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Revenue analytics error: {e}")
         import traceback
@@ -174,20 +297,21 @@ def get_revenue_analytics():
 
 
 @admin_bp.route('/analytics/orders', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_orders_analytics():
     """Get orders analytics - total, daily orders"""
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             # Total orders
-            cursor.execute("SELECT COUNT(*) as total FROM orders")
+            cursor.execute("SELECT COALESCE(SUM(order_count), 0) as total FROM daily_sales")
             total_orders = int(cursor.fetchone()['total'])
             
             # Orders per day (last 30 days)
             cursor.execute("""
-                SELECT date, COUNT(*) as order_count
-                FROM orders
+                SELECT date, order_count
+                FROM daily_sales
                 WHERE date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY date
                 ORDER BY date
             """)
             daily_orders = [{'date': str(row['date']), 'count': int(row['order_count'])} for row in cursor.fetchall()]
@@ -196,26 +320,29 @@ def get_orders_analytics():
                 'total_orders': total_orders,
                 'daily_orders': daily_orders
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Orders analytics error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
 @admin_bp.route('/analytics/products', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_product_analytics():
     """Get product analytics - top selling, least selling, distribution"""
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             # Top selling products (by quantity sold)
             cursor.execute("""
                 SELECT 
                     p.id,
                     p.name,
-                    COALESCE(SUM(oi.quantity), 0) as total_sold,
-                    COALESCE(SUM(oi.quantity * oi.price_at_purchase), 0) as total_revenue
+                    COALESCE(ps.quantity_sold, 0) as total_sold,
+                    COALESCE(ps.revenue, 0) as total_revenue
                 FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                GROUP BY p.id, p.name
+                LEFT JOIN product_sales ps ON ps.product_id = p.id
                 ORDER BY total_sold DESC
                 LIMIT 10
             """)
@@ -231,10 +358,9 @@ def get_product_analytics():
                 SELECT 
                     p.id,
                     p.name,
-                    COALESCE(SUM(oi.quantity), 0) as total_sold
+                    COALESCE(ps.quantity_sold, 0) as total_sold
                 FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                GROUP BY p.id, p.name
+                LEFT JOIN product_sales ps ON ps.product_id = p.id
                 ORDER BY total_sold ASC, p.name
                 LIMIT 10
             """)
@@ -248,10 +374,9 @@ def get_product_analytics():
             cursor.execute("""
                 SELECT 
                     p.name,
-                    COALESCE(SUM(oi.quantity * oi.price_at_purchase), 0) as revenue
+                    COALESCE(ps.revenue, 0) as revenue
                 FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                GROUP BY p.id, p.name
+                LEFT JOIN product_sales ps ON ps.product_id = p.id
                 ORDER BY revenue DESC
                 LIMIT 10
             """)
@@ -265,6 +390,8 @@ def get_product_analytics():
                 'least_products': least_products,
                 'product_distribution': product_distribution
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Product analytics error: {e}")
         import traceback
@@ -273,10 +400,12 @@ def get_product_analytics():
 
 
 @admin_bp.route('/analytics/customers', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_customer_analytics():
     """Get customer analytics - total users, new users per month, repeat vs new"""
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             # Total users
             cursor.execute("SELECT COUNT(*) as total FROM users")
             total_users = int(cursor.fetchone()['total'])
@@ -303,10 +432,9 @@ def get_customer_analytics():
                     END as customer_type,
                     COUNT(*) as count
                 FROM (
-                    SELECT u.email, COALESCE(COUNT(o.order_id), 0) as order_count
+                    SELECT u.email, COALESCE(cs.order_count, 0) as order_count
                     FROM users u
-                    LEFT JOIN orders o ON u.email = o.email
-                    GROUP BY u.email
+                    LEFT JOIN customer_sales cs ON cs.email = u.email
                 ) as user_orders
                 GROUP BY customer_type
             """)
@@ -314,7 +442,7 @@ def get_customer_analytics():
             customer_types = {row['customer_type']: int(row['count']) for row in cursor.fetchall()}
             
             # Count users who placed orders
-            cursor.execute("SELECT COUNT(DISTINCT email) as count FROM orders")
+            cursor.execute("SELECT COUNT(*) as count FROM customer_sales")
             users_with_orders = int(cursor.fetchone()['count'] or 0)
             
             return jsonify({
@@ -323,6 +451,8 @@ def get_customer_analytics():
                 'customer_types': customer_types,
                 'users_with_orders': users_with_orders
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Customer analytics error: {e}")
         import traceback
@@ -331,16 +461,18 @@ def get_customer_analytics():
 
 
 @admin_bp.route('/analytics/conversion', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_conversion_metrics():
     """Get conversion metrics - users vs customers, conversion rate"""
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             # Total users
             cursor.execute("SELECT COUNT(*) as total FROM users")
             total_users = int(cursor.fetchone()['total'])
             
             # Users who placed orders
-            cursor.execute("SELECT COUNT(DISTINCT email) as count FROM orders")
+            cursor.execute("SELECT COUNT(*) as count FROM customer_sales")
             users_with_orders = int(cursor.fetchone()['count'] or 0)
             
             # Calculate conversion rate
@@ -352,69 +484,70 @@ def get_conversion_metrics():
                 'users_without_orders': total_users - users_with_orders,
                 'conversion_rate': round(conversion_rate, 2)
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Conversion metrics error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
 @admin_bp.route('/analytics/overview', methods=['GET'])
+@require_auth('admin')
+@cached_view(analytics_cache)
 def get_analytics_overview():
-    """Get all analytics data in one call - optimized single query approach"""
+    """Get all analytics data in one call - a single statement over the rollup tables"""
     try:
-        # Get all data with efficient queries
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            # Revenue
-            cursor.execute("SELECT COALESCE(SUM(amount), 0) as total FROM orders")
-            total_revenue = float(cursor.fetchone()['total'] or 0)
-            
-            cursor.execute("""
-                SELECT date, COALESCE(SUM(amount), 0) as revenue
-                FROM orders
-                WHERE date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY date
-                ORDER BY date
-            """)
-            daily_revenue = [{'date': str(row['date']), 'revenue': float(row['revenue'])} for row in cursor.fetchall()]
-            
-            # Orders
-            cursor.execute("SELECT COUNT(*) as total FROM orders")
-            total_orders = int(cursor.fetchone()['total'])
-            
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
             cursor.execute("""
-                SELECT date, COUNT(*) as order_count
-                FROM orders
-                WHERE date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY date
-                ORDER BY date
-            """)
-            daily_orders = [{'date': str(row['date']), 'count': int(row['order_count'])} for row in cursor.fetchall()]
-            
-            # Products
-            cursor.execute("""
-                SELECT 
-                    p.id, p.name,
-                    COALESCE(SUM(oi.quantity), 0) as total_sold,
-                    COALESCE(SUM(oi.quantity * oi.price_at_purchase), 0) as total_revenue
-                FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                GROUP BY p.id, p.name
-                ORDER BY total_sold DESC
-                LIMIT 10
+                WITH totals AS (
+                    SELECT COALESCE(SUM(revenue), 0) as total_revenue,
+                           COALESCE(SUM(order_count), 0) as total_orders
+                    FROM daily_sales
+                ), daily AS (
+                    SELECT COALESCE(json_agg(json_build_object(
+                               'date', date::text,
+                               'revenue', revenue,
+                               'count', order_count
+                           ) ORDER BY date), '[]') as days
+                    FROM daily_sales
+                    WHERE date >= CURRENT_DATE - INTERVAL '30 days'
+                ), top AS (
+                    SELECT COALESCE(json_agg(json_build_object(
+                               'id', id,
+                               'name', name,
+                               'total_sold', total_sold,
+                               'total_revenue', total_revenue
+                           ) ORDER BY total_sold DESC, id), '[]') as products
+                    FROM (
+                        SELECT p.id, p.name,
+                               COALESCE(ps.quantity_sold, 0) as total_sold,
+                               COALESCE(ps.revenue, 0) as total_revenue
+                        FROM products p
+                        LEFT JOIN product_sales ps ON ps.product_id = p.id
+                        ORDER BY total_sold DESC, p.id
+                        LIMIT 10
+                    ) ranked
+                ), customers AS (
+                    SELECT (SELECT COUNT(*) FROM users) as total_users,
+                           (SELECT COUNT(*) FROM customer_sales) as users_with_orders
+                )
+                SELECT * FROM totals, daily, top, customers
             """)
+            row = cursor.fetchone()
+
+            total_revenue = float(row['total_revenue'])
+            total_orders = int(row['total_orders'])
+            daily_revenue = [{'date': day['date'], 'revenue': float(day['revenue'])} for day in row['days']]
+            daily_orders = [{'date': day['date'], 'count': int(day['count'])} for day in row['days']]
             top_products = [{
-                'id': int(row['id']),
-                'name': row['name'],
-                'total_sold': int(row['total_sold']),
-                'total_revenue': float(row['total_revenue'])
-            } for row in cursor.fetchall()]
-            
-            # Customers
-            cursor.execute("SELECT COUNT(*) as total FROM users")
-            total_users = int(cursor.fetchone()['total'])
-            
-            cursor.execute("SELECT COUNT(DISTINCT email) as count FROM orders")
-            users_with_orders = int(cursor.fetchone()['count'] or 0)
-            
+                'id': int(product['id']),
+                'name': product['name'],
+                'total_sold': int(product['total_sold']),
+                'total_revenue': float(product['total_revenue'])
+            } for product in row['products']]
+            total_users = int(row['total_users'])
+            users_with_orders = int(row['users_with_orders'])
+
             conversion_rate = (users_with_orders / total_users * 100) if total_users > 0 else 0
             
             return jsonify({
@@ -439,6 +572,8 @@ def get_analytics_overview():
                     'conversion_rate': round(conversion_rate, 2)
                 }
             })
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Analytics overview error: {e}")
         import traceback
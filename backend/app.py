@@ -1,53 +1,97 @@
-from flask import Flask, send_from_directory
+import logging
+import os
+from flask import Flask, jsonify
 from flask_cors import CORS
 from auth import auth_bp
 from admin import admin_bp
 from user import user_bp
-import os
 from dotenv import load_dotenv
-from db import init_db_pool, create_database_if_not_exists
-from db_init import init_schema, migrate_csv_data
+from db import PoolTimeout, get_db_pool
+from email_service import start_outbox_worker
+from catalog import catalog_response
+import metrics
+from serialization import FastJSONProvider
+import statements
+from images import image_response
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+logger = logging.getLogger(__name__)
 
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(admin_bp, url_prefix='/admin')
-app.register_blueprint(user_bp, url_prefix='/user')
+# Prepared on every warm pooled connection before a worker takes traffic
+WARM_STATEMENTS = ('login_user', 'cart_items', 'cart_view', 'cart_upsert', 'catalog_all', 'catalog_page')
 
-@app.route('/static/images/<filename>')
 def serve_image(filename):
-    return send_from_directory(os.path.join(app.root_path, 'static/images'), filename)
+    return image_response(filename)
+
+def serve_image_variant(filename, size):
+    # size is one of images.VARIANTS: thumb, card, full
+    return image_response(filename, size)
 
-@app.route('/')
 def home():
     return {"message": "Backend is running!"}
 
-def initialize_database():
-    """Initialize database on application startup"""
+def pool_busy(e):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT: overloaded, not broken
+    logger.warning(f"Rejecting request: {e}")
+    response = jsonify({'error': 'Server busy, try again shortly'})
+    response.headers['Retry-After'] = os.getenv('DB_POOL_RETRY_AFTER', '1')
+    return response, 503
+
+def create_app():
+    """Build the Flask application.
+
+    Does no database I/O: the schema is managed by `python db_init.py` and
+    the connection pool opens on first use (or in warm_up()), so the app
+    can be created in a pre-forking server's master process.
+    """
+    app = Flask(__name__)
+    # orjson-backed jsonify() that also encodes Decimal and date
+    app.json = FastJSONProvider(app)
+    CORS(app, expose_headers=['X-Next-Cursor', 'Content-Disposition'])
+
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(user_bp, url_prefix='/user')
+
+    # Per-endpoint latency, SQL count/time per request and pool state at /metrics
+    metrics.init_app(app)
+    app.register_error_handler(PoolTimeout, pool_busy)
+
+    app.add_url_rule('/static/images/<filename>', 'serve_image', serve_image)
+    app.add_url_rule('/static/images/<size>/<filename>', 'serve_image_variant', serve_image_variant)
+    app.add_url_rule('/', 'home', home)
+    return app
+
+def warm_up(app):
+    """Open the pool, prepare the hot statements and fill the catalog cache.
+
+    Failures are logged, not raised: a worker that can't reach the
+    database yet still starts and connects on first use.
+    """
     try:
-        # Create database if it doesn't exist
-        create_database_if_not_exists()
-        
-        # Initialize connection pool
-        init_db_pool()
-        
-        # Create schema if needed
-        init_schema()
-        
-        # Migrate CSV data if needed
-        migrate_csv_data()
-        
-        print("Database initialized successfully")
+        pool = get_db_pool()
+        # Check out every connection the pool opened so each one gets prepared
+        held = [pool.getconn() for _ in range(max(pool.minconn, 1))]
+        try:
+            for conn in held:
+                with conn.cursor() as cursor:
+                    for name in WARM_STATEMENTS:
+                        statements.prepare(cursor, name)
+                conn.commit()
+        finally:
+            for conn in held:
+                pool.putconn(conn)
+        with app.app_context():
+            catalog_response()
+        logger.info(f"Warmed up {len(held)} connections and the catalog cache")
     except Exception as e:
-        print(f"Error initializing database: {e}")
-        print("Application will continue, but database operations may fail.")
-
-# Initialize database when app starts
-initialize_database()
+        logger.warning(f"Warm-up incomplete, starting cold: {e}")
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; see gunicorn.conf.py for production.
+    # (`flask --app app run` finds create_app() on its own.)
+    # Send queued email in the background (or run `python email_service.py` separately)
+    start_outbox_worker()
+    create_app().run(debug=True)
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
 from utils import generate_code
-from email_service import send_email, send_reset_code_email
-from db import get_db_cursor, execute_query
+from email_service import queue_reset_code_email, notify_outbox
+from db import PoolTimeout, get_db_cursor, execute_query
+import statements
+from rollups import invalidate_analytics
+from tokens import issue_token, TOKEN_TTL
 from datetime import datetime, timedelta
 
 
@@ -29,10 +32,11 @@ def signup():
                 (email, password)
             )
             conn.commit()
+            invalidate_analytics()
             return jsonify({'message': 'Signup successful'}), 200
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         # If it's a unique constraint violation, user already exists
         if 'unique' in str(e).lower() or 'duplicate' in str(e).lower():
             return jsonify({'error': 'Email already exists'}), 400
@@ -60,7 +64,7 @@ def login():
         table = 'admins' if is_admin else 'users'
         with get_db_cursor() as (cursor, conn):
             # First check if user exists (case-insensitive email comparison)
-            cursor.execute(f"SELECT email, password FROM {table} WHERE LOWER(email) = LOWER(%s)", (email,))
+            statements.execute(cursor, 'login_admin' if is_admin else 'login_user', (email,))
             user = cursor.fetchone()
             
             if not user:
@@ -76,7 +80,17 @@ def login():
                 return jsonify({'error': 'Invalid credentials'}), 401
             
             print(f"Login successful for {email}")
-            return jsonify({'message': 'Login successful'}), 200
+            # Later requests identify themselves with this token instead of an email
+            role = 'admin' if is_admin else 'user'
+            return jsonify({
+                'message': 'Login successful',
+                'token': issue_token(user[0], role),
+                'email': user[0],
+                'role': role,
+                'expires_in': TOKEN_TTL
+            }), 200
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Login error: {str(e)}")
         import traceback
@@ -118,18 +132,18 @@ def forgot_password():
                 "INSERT INTO reset_codes (email, code, expires_at) VALUES (%s, %s, %s)",
                 (email, code, expires_at)
             )
+            queue_reset_code_email(cursor, email, code)
             conn.commit()
-            print(f"Reset code saved to database")
+            print(f"Reset code saved and email queued for {email}")
 
-        send_reset_code_email(email, code)
-        print(f"Reset code email sent to {email}")
+        notify_outbox()
         return jsonify({'message': 'Reset code sent to your email'}), 200
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Forgot password error: {str(e)}")
         import traceback
         traceback.print_exc()
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -186,10 +200,10 @@ def reset_password():
 
             print(f"Password reset successful for {email}")
             return jsonify({'message': 'Password reset successful'}), 200
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Reset password error: {str(e)}")
         import traceback
         traceback.print_exc()
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
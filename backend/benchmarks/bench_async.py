@@ -0,0 +1,140 @@
+"""
+Sync vs async (gevent) serving benchmark under slow clients
+
+Starts the app twice on local ports, once on the threaded development
+server that `python app.py` uses and once through serve_async.py, and for
+each one:
+
+1. opens --slow-clients connections that send a request's headers one
+   line at a time, every few seconds, and never finish it (each one ties
+   up whatever the server dedicates to a connection);
+2. runs the loadtest.py scenario mix against it at each --concurrency
+   level and reports throughput, errors and p50/p95/p99 per endpoint.
+
+Needs the load test dataset (`python benchmarks/loadtest.py seed`) and,
+for the async server, gevent and psycogreen.
+
+Usage:
+    python benchmarks/bench_async.py [--modes sync,async] [--slow-clients 2000]
+                                     [--concurrency 8,64,256] [--duration 20]
+"""
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from loadtest import HTTPClient, dataset_shape, print_level, run_level
+
+BACKEND = os.path.join(os.path.dirname(__file__), '..')
+
+SERVERS = {
+    'sync': lambda port: [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port),
+                          '--with-threads', '--no-reload', '--no-debugger'],
+    'async': lambda port: [sys.executable, 'serve_async.py', '--port', str(port), '--no-outbox'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port):
+    process = subprocess.Popen(SERVERS[mode](port), cwd=BACKEND,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{mode} server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit(f"{mode} server did not start listening on port {port}")
+
+
+class SlowClients:
+    """Connections that keep a request half-sent until stopped"""
+
+    def __init__(self, port, count, interval=5.0):
+        self.port = port
+        self.count = count
+        self.interval = interval
+        self.sockets = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._trickle, daemon=True)
+
+    def start(self):
+        for _ in range(self.count):
+            try:
+                s = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+                s.sendall(b"GET /user/products?limit=50 HTTP/1.1\r\nHost: localhost\r\n")
+                self.sockets.append(s)
+            except OSError:
+                break
+        self._thread.start()
+        return len(self.sockets)
+
+    def _trickle(self):
+        while not self._stop.wait(self.interval):
+            for s in list(self.sockets):
+                try:
+                    s.sendall(b"X-Slow: 1\r\n")
+                except OSError:
+                    self.sockets.remove(s)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        for s in self.sockets:
+            s.close()
+        return len(self.sockets)
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--slow-clients', type=int, default=2000)
+    parser.add_argument('--concurrency', default='8,64,256')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency level')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    raise_fd_limit(args.slow_clients + max(levels) + 256)
+    users, products = dataset_shape()
+
+    for mode in args.modes.split(','):
+        port = free_port()
+        server = start_server(mode, port)
+        slow = SlowClients(port, args.slow_clients)
+        try:
+            opened = slow.start()
+            print(f"\n===== {mode} server, {opened} slow clients held open =====")
+            url = f"http://127.0.0.1:{port}"
+            for concurrency in levels:
+                results = run_level(lambda: HTTPClient(url), concurrency, args.duration, users, products, args.seed)
+                print_level(concurrency, results)
+            print(f"\n{slow.stop()} of {opened} slow clients still connected at the end")
+        finally:
+            server.terminate()
+            server.wait(10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+JSON serialization benchmark for the large admin list responses
+
+Encodes synthetic /admin/orders rows (Decimal amounts, date columns, as
+psycopg2 returns them) two ways and reports CPU time and peak Python
+memory (tracemalloc) for each:
+
+- buffered: fetchall(), a list of converted dicts, then Flask's default
+  jsonify, which is what the endpoints used to do;
+- streamed: fetchmany() batches encoded by serialization.dumps() as the
+  chunks of a streamed response, which is what they do now.
+
+A "rows only" line shows the cost of generating the rows themselves.
+
+No database is needed: rows are generated in memory, batch by batch for
+the streamed path as a server-side cursor would hand them out.
+
+Usage:
+    python benchmarks/bench_json.py [--rows 10000,100000,500000] [--repeat 3]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, jsonify
+import serialization
+from serialization import STREAM_BATCH_ROWS, dumps
+
+
+def make_row(i):
+    return {
+        'order_id': str(1000000000 + i),
+        'user_email': f'shopper{i % 5000}@example.com',
+        'total_price': Decimal(f'{(i * 37) % 100000}.{i % 100:02d}'),
+        'date': datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 365),
+    }
+
+
+def fetch_batches(count, size):
+    for start in range(0, count, size):
+        yield [make_row(i) for i in range(start, min(start + size, count))]
+
+
+def rows_only(count):
+    """Cost of producing the rows alone, to subtract from the other two"""
+    return sum(len(rows) for rows in fetch_batches(count, STREAM_BATCH_ROWS)) and 0
+
+
+def buffered(count):
+    rows = [make_row(i) for i in range(count)]
+    result = []
+    for row in rows:
+        result.append({
+            'order_id': row['order_id'],
+            'user_email': row['user_email'],
+            'total_price': float(row['total_price']),
+            'date': str(row['date'])
+        })
+    return len(jsonify(result).get_data())
+
+
+def streamed(count):
+    size = 1
+    separator = b''
+    for rows in fetch_batches(count, STREAM_BATCH_ROWS):
+        size += len(separator + dumps(rows)[1:-1])
+        separator = b','
+    return size + 1
+
+
+def measure(fn, count, repeat):
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(count)
+        cpu.append(time.process_time() - start)
+    tracemalloc.start()
+    size = fn(count)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(cpu), peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', default='10000,100000,500000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    encoder = 'orjson' if serialization.orjson is not None else 'json (orjson not installed)'
+    print(f"encoder: {encoder}, batch size {STREAM_BATCH_ROWS}")
+    print(f"{'rows':>8} {'path':<10} {'cpu s':>8} {'peak MiB':>9} {'body MiB':>9}")
+    with app.app_context():
+        for count in (int(n) for n in args.rows.split(',')):
+            for label, fn in (('rows only', rows_only), ('buffered', buffered), ('streamed', streamed)):
+                cpu, peak, size = measure(fn, count, args.repeat)
+                print(f"{count:>8} {label:<10} {cpu:>8.3f} {peak / 2**20:>9.1f} {size / 2**20:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
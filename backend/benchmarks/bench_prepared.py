@@ -0,0 +1,112 @@
+"""
+Prepared statement benchmark for the hot read paths
+
+Runs each statement from statements.py two ways on one connection: as a
+plain parameterized query (parsed and planned on every call, which is what
+the blueprints used to do) and through EXECUTE of the named prepared
+statement. Reports the server-side planning time from EXPLAIN ANALYZE and
+the client-side round trip time. Uses existing rows from the database and
+rolls back everything it runs.
+
+Usage:
+    python benchmarks/bench_prepared.py [--repeat 500]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from db import get_db_config
+import statements
+
+BENCHED = ['login_user', 'cart_items', 'catalog_page', 'catalog_all', 'checkout_lock_cart']
+
+
+def sample_params(cursor):
+    cursor.execute("SELECT email FROM cart GROUP BY email ORDER BY COUNT(*) DESC LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("SELECT email FROM users LIMIT 1")
+        row = cursor.fetchone()
+    if row is None:
+        sys.exit("No users in the database; run `python db_init.py` first")
+    email = row[0]
+    return {
+        'login_user': (email,),
+        'cart_items': (email,),
+        'catalog_page': (0, 51),
+        'catalog_all': (),
+        'checkout_lock_cart': (email,),
+    }
+
+
+def adhoc_sql(name):
+    """The registered SQL with $n turned back into client-side %(n)s parameters"""
+    return re.sub(r'\$(\d+)', r'%(\1)s', statements.STATEMENTS[name].replace('%', '%%'))
+
+
+def adhoc_params(params):
+    return {str(i): value for i, value in enumerate(params, 1)}
+
+
+def planning_ms(cursor, sql, params):
+    cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Planning Time']
+
+
+def bench(cursor, conn, name, params, repeat):
+    sql = adhoc_sql(name)
+    named = adhoc_params(params)
+    execute_sql = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(params))})" if params else "")
+
+    statements.prepare(cursor, name)
+    # Let the server settle on its plan (custom plans for the first five executions)
+    for _ in range(10):
+        cursor.execute(execute_sql, params)
+
+    results = {}
+    for label, run_sql, run_params in (('adhoc', sql, named), ('prepared', execute_sql, params)):
+        plans, trips = [], []
+        for _ in range(repeat):
+            plans.append(planning_ms(cursor, run_sql, run_params))
+            start = time.perf_counter()
+            cursor.execute(run_sql, run_params)
+            cursor.fetchall()
+            trips.append((time.perf_counter() - start) * 1000)
+        results[label] = (statistics.mean(plans), statistics.median(trips))
+    conn.rollback()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**get_db_config())
+    cursor = conn.cursor()
+    try:
+        params = sample_params(cursor)
+        conn.rollback()
+        print(f"{'statement':<20} {'plan adhoc':>11} {'plan prep':>11} {'p50 adhoc':>11} {'p50 prep':>11}  (ms)")
+        for name in BENCHED:
+            results = bench(cursor, conn, name, params[name], args.repeat)
+            adhoc_plan, adhoc_p50 = results['adhoc']
+            prep_plan, prep_p50 = results['prepared']
+            print(f"{name:<20} {adhoc_plan:>11.3f} {prep_plan:>11.3f} {adhoc_p50:>11.3f} {prep_p50:>11.3f}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Product search benchmark against a synthetic catalog
+
+Builds catalogs of increasing size in a scratch schema (the real products
+table is never touched) and compares the old ILIKE '%q%' query on the btree
+schema with the ranked trigram search from catalog.py.
+
+Usage:
+    python benchmarks/bench_search.py [--sizes 25,10000,100000,500000] [--repeat 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from db import get_db_config
+from catalog import search_products, normalize_query
+
+SCHEMA = 'bench_search'
+
+QUERIES = ['mouse', 'wireless', 'smart watch', 'mouce', 'headphnes', 'x42', 'pro stand', 'cable']
+
+ADJECTIVES = ['Wireless', 'Smart', 'Portable', 'Compact', 'Premium', 'Gaming', 'Ultra',
+              'Mini', 'Pro', 'Classic', 'Digital', 'Magnetic']
+NOUNS = ['Mouse', 'Keyboard', 'Speaker', 'Headphones', 'Watch', 'Charger', 'Cable',
+         'Stand', 'Camera', 'Projector', 'Router', 'Tablet', 'Trimmer', 'Console',
+         'Vacuum', 'Extender', 'Monitor', 'Lamp', 'Tripod', 'Case']
+
+
+def build_catalog(cursor, size):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path TO {SCHEMA}, public")
+    cursor.execute("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            stock INTEGER NOT NULL DEFAULT 0,
+            image VARCHAR(255)
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO products (id, name, price, stock, image)
+        SELECT g,
+               (%(adjectives)s)[1 + g %% %(n_adj)s] || ' '
+                   || (%(nouns)s)[1 + (g / %(n_adj)s) %% %(n_nouns)s] || ' X' || (g %% 997),
+               round((random() * 5000)::numeric, 2),
+               (random() * 100)::int,
+               'bench.jpg'
+        FROM generate_series(1, %(size)s) AS g
+    """, {
+        'adjectives': ADJECTIVES, 'n_adj': len(ADJECTIVES),
+        'nouns': NOUNS, 'n_nouns': len(NOUNS),
+        'size': size
+    })
+    # Only the btree index the schema had before trigram search
+    cursor.execute("CREATE INDEX ON products(name)")
+    cursor.execute("ANALYZE products")
+
+
+def add_trigram_index(cursor):
+    cursor.execute("CREATE INDEX ON products USING GIN (name gin_trgm_ops)")
+    cursor.execute("ANALYZE products")
+
+
+def time_queries(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='25,10000,100000,500000')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**get_db_config())
+    conn.autocommit = True
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    def legacy(query):
+        cursor.execute(
+            "SELECT id, name, price, stock, image FROM products WHERE name ILIKE %s",
+            (f'%{query}%',)
+        )
+        cursor.fetchall()
+
+    def ranked(query):
+        # SET LOCAL needs a transaction block even in autocommit mode
+        cursor.execute("BEGIN")
+        search_products(cursor, normalize_query(query))
+        cursor.execute("COMMIT")
+
+    print(f"{'rows':>10} {'legacy p50':>12} {'legacy p95':>12} {'ranked p50':>12} {'ranked p95':>12}  (ms)")
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            build_catalog(cursor, size)
+            legacy_p50, legacy_p95 = time_queries(legacy, args.repeat)
+            add_trigram_index(cursor)
+            ranked_p50, ranked_p95 = time_queries(ranked, args.repeat)
+            print(f"{size:>10} {legacy_p50:>12.2f} {legacy_p95:>12.2f} {ranked_p50:>12.2f} {ranked_p95:>12.2f}")
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Checkout contention check: many concurrent buyers, one low-stock product
+
+Creates a scratch product with a small stock and one scratch user per
+thread, each holding that product in their cart, then fires every
+checkout at once through the Flask app, each with its own session
+token. Fails (exit code 1) if more units were sold than were in stock,
+the stock went negative, a checkout was rejected as unauthenticated, or
+nothing sold although there was stock.
+
+Usage:
+    python benchmarks/checkout_contention.py [--threads 50] [--stock 5] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from db import get_db_cursor
+from email_service import stop_outbox_worker
+from rollups import rebuild_rollups
+from tokens import issue_token
+
+app = create_app()
+
+PRODUCT_ID = 900000001
+EMAIL_TEMPLATE = 'contention-{}@bench.invalid'
+
+
+def setup(threads, stock):
+    with get_db_cursor() as (cursor, conn):
+        cleanup(cursor)
+        cursor.execute(
+            "INSERT INTO products (id, name, price, stock, image) VALUES (%s, %s, %s, %s, %s)",
+            (PRODUCT_ID, 'Contention Test Product', 10.0, stock, None)
+        )
+        for i in range(threads):
+            email = EMAIL_TEMPLATE.format(i)
+            cursor.execute("INSERT INTO users (email, password) VALUES (%s, %s)", (email, 'x'))
+            cursor.execute(
+                "INSERT INTO cart (email, product_id, quantity) VALUES (%s, %s, %s)",
+                (email, PRODUCT_ID, 1)
+            )
+        conn.commit()
+
+
+def cleanup(cursor):
+    cursor.execute("DELETE FROM email_outbox WHERE recipient LIKE %s", (EMAIL_TEMPLATE.format('%'),))
+    cursor.execute(
+        "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders WHERE email LIKE %s)",
+        (EMAIL_TEMPLATE.format('%'),)
+    )
+    cursor.execute("DELETE FROM orders WHERE email LIKE %s", (EMAIL_TEMPLATE.format('%'),))
+    cursor.execute("DELETE FROM users WHERE email LIKE %s", (EMAIL_TEMPLATE.format('%'),))
+    cursor.execute("DELETE FROM products WHERE id = %s", (PRODUCT_ID,))
+    # Take the scratch orders back out of daily_sales
+    rebuild_rollups(cursor)
+
+
+def run_round(threads, stock):
+    setup(threads, stock)
+    barrier = threading.Barrier(threads)
+    statuses = []
+    lock = threading.Lock()
+
+    def buyer(i):
+        client = app.test_client()
+        email = EMAIL_TEMPLATE.format(i)
+        headers = {'Authorization': f'Bearer {issue_token(email)}'}
+        barrier.wait()
+        response = client.post('/user/place-order', json={'email': email}, headers=headers)
+        with lock:
+            statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=buyer, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute("SELECT stock FROM products WHERE id = %s", (PRODUCT_ID,))
+        final_stock = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = %s", (PRODUCT_ID,))
+        sold = cursor.fetchone()[0]
+        cleanup(cursor)
+        conn.commit()
+
+    placed = statuses.count(200)
+    oversold = not (final_stock >= 0 and sold <= stock and sold == stock - final_stock and placed == sold)
+    # Without this a run where every checkout is rejected would pass
+    rejected = any(status in (401, 403) for status in statuses)
+    untested = placed == 0 and stock > 0
+    verdict = 'OVERSOLD' if oversold else 'AUTH REJECTED' if rejected else 'NOTHING SOLD' if untested else 'OK'
+    print(f"orders placed={placed} units sold={sold} final stock={final_stock} "
+          f"other statuses={sorted(set(s for s in statuses if s != 200))} -> {verdict}")
+    return verdict == 'OK'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--stock', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    # Confirmation mail for the scratch addresses is queued but never sent
+    stop_outbox_worker()
+
+    results = [run_round(args.threads, args.stock) for _ in range(args.rounds)]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+End-to-end HTTP load test with latency baselines
+
+Seeds the database with a synthetic dataset (loaded with COPY through
+bulk_load.py, all of it namespaced so it can be removed again), then
+drives a weighted mix of shopper and admin scenarios at each concurrency
+level and reports throughput and p50/p95/p99 latency per endpoint.
+
+Requests go through the Flask app in-process by default, or to a running
+server with --url. With --baseline, the results are compared with a
+stored run and the script exits 1 if any endpoint's p95 or throughput
+regressed by more than --tolerance, or if it started failing.
+
+Usage:
+    python benchmarks/loadtest.py seed [--users 1000 --products 5000 --orders 20000]
+    python benchmarks/loadtest.py run [--concurrency 1,8,32] [--duration 20] [--url http://localhost:8000]
+                                      [--baseline benchmarks/loadtest_baseline.json] [--save-baseline PATH]
+    python benchmarks/loadtest.py cleanup
+"""
+import argparse
+import csv
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from db import get_db_config
+from bulk_load import load_all
+from rollups import rebuild_rollups
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+EMAIL_TEMPLATE = 'shopper{}@' + EMAIL_DOMAIN
+PASSWORD_TEMPLATE = 'pw{}'
+ADMIN_EMAIL = 'admin@' + EMAIL_DOMAIN
+ADMIN_PASSWORD = 'pw-admin'
+# Only these response bodies are read back (for the session tokens)
+AUTH_PREFIX = '/auth/'
+ORDER_PREFIX = 'lt-'
+PRODUCT_BASE = 800000000
+# The seeded products: ids from PRODUCT_BASE up, all inserted by the seed
+# transaction and so sharing its created_at. Products an admin adds later
+# (MAX(id) + 1, so also above PRODUCT_BASE) are never matched.
+SEEDED_PRODUCTS = """id >= %(base)s AND created_at = (
+    SELECT created_at FROM products WHERE id = %(base)s)"""
+STOCK = 10_000_000
+
+SEARCH_TERMS = ['mouse', 'wireless', 'smart watch', 'headphnes', 'stand', 'cable', 'pro', 'x42']
+ADJECTIVES = ['Wireless', 'Smart', 'Portable', 'Compact', 'Premium', 'Gaming', 'Ultra',
+              'Mini', 'Pro', 'Classic', 'Digital', 'Magnetic']
+NOUNS = ['Mouse', 'Keyboard', 'Speaker', 'Headphones', 'Watch', 'Charger', 'Cable',
+         'Stand', 'Camera', 'Projector', 'Router', 'Tablet', 'Trimmer', 'Console']
+
+# scenario -> relative weight in the mix
+SCENARIOS = {
+    'browse': 30,
+    'search': 20,
+    'cart': 20,
+    'checkout': 5,
+    'order_history': 15,
+    'admin_analytics': 5,
+    'admin_orders': 5,
+}
+
+
+# ============= DATASET =============
+
+def write_dataset(directory, users, products, orders, seed):
+    rng = random.Random(seed)
+    directory = Path(directory)
+
+    with open(directory / 'users.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['email', 'password'])
+        writer.writerows((EMAIL_TEMPLATE.format(i), PASSWORD_TEMPLATE.format(i)) for i in range(users))
+
+    with open(directory / 'admin.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['email', 'password'])
+        writer.writerow([ADMIN_EMAIL, ADMIN_PASSWORD])
+
+    prices = {}
+    with open(directory / 'products.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'name', 'price', 'stock', 'image'])
+        for i in range(products):
+            product_id = PRODUCT_BASE + i
+            prices[product_id] = round(rng.uniform(99, 4999), 2)
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} X{i % 997}"
+            writer.writerow([product_id, name, prices[product_id], STOCK, ''])
+
+    today = time.time()
+    product_ids = list(prices)
+    with open(directory / 'orders.csv', 'w', newline='') as f, \
+            open(directory / 'order_items.csv', 'w', newline='') as items_file:
+        writer = csv.writer(f)
+        items = csv.writer(items_file)
+        writer.writerow(['order_id', 'email', 'amount', 'date'])
+        items.writerow(['order_id', 'product_id', 'quantity', 'price_at_purchase'])
+        for i in range(orders):
+            order_id = f'{ORDER_PREFIX}{i:08d}'
+            lines = [(product_id, rng.randint(1, 3)) for product_id in rng.sample(product_ids, rng.randint(1, 4))]
+            amount = sum(prices[product_id] * quantity for product_id, quantity in lines)
+            date = time.strftime('%Y-%m-%d', time.localtime(today - rng.randint(0, 365) * 86400))
+            writer.writerow([order_id, EMAIL_TEMPLATE.format(rng.randrange(users)), round(amount, 2), date])
+            items.writerows((order_id, product_id, quantity, prices[product_id]) for product_id, quantity in lines)
+
+
+def cleanup(cursor):
+    pattern = f'%@{EMAIL_DOMAIN}'
+    cursor.execute("DELETE FROM email_outbox WHERE recipient LIKE %s", (pattern,))
+    cursor.execute(
+        "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders WHERE email LIKE %s)",
+        (pattern,)
+    )
+    cursor.execute("DELETE FROM orders WHERE email LIKE %s", (pattern,))
+    cursor.execute("DELETE FROM users WHERE email LIKE %s", (pattern,))
+    cursor.execute("DELETE FROM admins WHERE email LIKE %s", (pattern,))
+    cursor.execute(f"DELETE FROM products WHERE {SEEDED_PRODUCTS}", {'base': PRODUCT_BASE})
+    rebuild_rollups(cursor)
+
+
+def seed(args):
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cursor = conn.cursor()
+        cleanup(cursor)
+        with tempfile.TemporaryDirectory() as directory:
+            write_dataset(directory, args.users, args.products, args.orders, args.seed)
+            load_all(cursor, data_dir=directory)
+        cursor.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Seeded {args.users} users, {args.products} products, {args.orders} orders")
+
+
+def run_cleanup(args):
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cleanup(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+    print("Load test data removed")
+
+
+def dataset_shape():
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users WHERE email LIKE %s", (f'%@{EMAIL_DOMAIN}',))
+        users = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM products WHERE {SEEDED_PRODUCTS}", {'base': PRODUCT_BASE})
+        products = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    if not users or not products:
+        sys.exit("No load test data found; run `python benchmarks/loadtest.py seed` first")
+    return users, products
+
+
+# ============= CLIENTS =============
+
+class InProcessClient:
+    """Calls the Flask app directly through its test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        data = response.get_json(silent=True) if path.startswith(AUTH_PREFIX) else None
+        response.close()
+        return response.status_code, data
+
+
+class HTTPClient:
+    """One keep-alive connection per virtual user to a running server"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        try:
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            raw = response.read()
+            data = json.loads(raw) if path.startswith(AUTH_PREFIX) and raw else None
+            return response.status, data
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+
+
+# ============= SCENARIOS =============
+
+class VirtualUser:
+    def __init__(self, client, recorder, index, product_count, rng):
+        self.client = client
+        self.recorder = recorder
+        self.email = EMAIL_TEMPLATE.format(index)
+        self.password = PASSWORD_TEMPLATE.format(index)
+        self.product_count = product_count
+        self.rng = rng
+        self.token = None
+        self.admin_token = None
+
+    def call(self, label, method, path, body=None, admin=False):
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body, self.admin_token if admin else self.token)
+        except Exception:
+            status, data = 0, None
+        self.recorder.record(label, time.perf_counter() - start, status)
+        return data
+
+    def login(self):
+        """Sign in as the shopper and as the load test admin; later calls send the tokens"""
+        data = self.call('POST /auth/login', 'POST', '/auth/login', {'email': self.email, 'password': self.password})
+        self.token = data.get('token') if isinstance(data, dict) else None
+        data = self.call('POST /auth/login (admin)', 'POST', '/auth/login',
+                         {'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD, 'admin': True})
+        self.admin_token = data.get('token') if isinstance(data, dict) else None
+
+    def product_id(self):
+        return PRODUCT_BASE + self.rng.randrange(self.product_count)
+
+    def browse(self):
+        self.call('GET /user/products (page)', 'GET', '/user/products?limit=50')
+
+    def search(self):
+        term = self.rng.choice(SEARCH_TERMS)
+        self.call('GET /user/products?search', 'GET', '/user/products?' + urlencode({'search': term}))
+
+    def cart(self):
+        self.call('POST /user/cart', 'POST', '/user/cart',
+                  {'email': self.email, 'product_id': self.product_id(), 'quantity': 1})
+        self.call('GET /user/cart/view', 'GET', f'/user/cart/{self.email}/view')
+
+    def checkout(self):
+        self.call('POST /user/cart', 'POST', '/user/cart',
+                  {'email': self.email, 'product_id': self.product_id(), 'quantity': 1})
+        self.call('POST /user/place-order', 'POST', '/user/place-order', {'email': self.email})
+
+    def order_history(self):
+        self.call('GET /user/orders', 'GET', f'/user/orders/{self.email}?limit=20')
+
+    def admin_analytics(self):
+        self.call('GET /admin/analytics/overview', 'GET', '/admin/analytics/overview', admin=True)
+
+    def admin_orders(self):
+        self.call('GET /admin/orders (page)', 'GET', '/admin/orders?limit=50', admin=True)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, label, seconds, status):
+        with self.lock:
+            self.samples[label].append(seconds)
+            if not 200 <= status < 400:
+                self.errors[label] += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+def run_level(make_client, concurrency, duration, users, products, seed):
+    recorder = Recorder()
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name] for name in names]
+    stop_at = time.monotonic() + duration
+    start_barrier = threading.Barrier(concurrency)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        # Each virtual user shops as its own customer so carts don't collide
+        user = VirtualUser(make_client(), recorder, index % users, products, rng)
+        user.login()
+        start_barrier.wait()
+        while time.monotonic() < stop_at:
+            getattr(user, rng.choices(names, weights)[0])()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    results = {}
+    for label, samples in recorder.samples.items():
+        samples.sort()
+        results[label] = {
+            'requests': len(samples),
+            'errors': recorder.errors[label],
+            'rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+        }
+    return results
+
+
+def print_level(concurrency, results):
+    print(f"\nconcurrency {concurrency}")
+    print(f"{'endpoint':<34} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label in sorted(results):
+        r = results[label]
+        print(f"{label:<34} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of human readable regressions against the baseline report"""
+    regressions = []
+    for level, endpoints in baseline['levels'].items():
+        current_level = report['levels'].get(level)
+        if current_level is None:
+            continue
+        for label, base in endpoints.items():
+            current = current_level.get(label)
+            if current is None or base['requests'] == 0:
+                continue
+            where = f"c={level} {label}"
+            if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{where}: p95 {base['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+            if current['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{where}: throughput {base['rps']:.1f} -> {current['rps']:.1f} req/s")
+            base_error_rate = base['errors'] / base['requests']
+            error_rate = current['errors'] / current['requests'] if current['requests'] else 1.0
+            if error_rate > base_error_rate + 0.01:
+                regressions.append(f"{where}: error rate {base_error_rate:.1%} -> {error_rate:.1%}")
+    return regressions
+
+
+def run(args):
+    users, products = dataset_shape()
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+    else:
+        from app import create_app
+        app = create_app()
+        make_client = lambda: InProcessClient(app)
+
+    report = {
+        'target': args.url or 'in-process',
+        'duration': args.duration,
+        'dataset': {'users': users, 'products': products},
+        'levels': {}
+    }
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        results = run_level(make_client, concurrency, args.duration, users, products, args.seed)
+        report['levels'][str(concurrency)] = results
+        print_level(concurrency, results)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        if not Path(args.baseline).exists():
+            print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+            return 0
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='load a synthetic dataset')
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--products', type=int, default=5000)
+    seed_parser.add_argument('--orders', type=int, default=20000)
+    seed_parser.add_argument('--seed', type=int, default=42)
+
+    run_parser = commands.add_parser('run', help='drive the scenario mix and report latencies')
+    run_parser.add_argument('--concurrency', default='1,8,32')
+    run_parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency level')
+    run_parser.add_argument('--url', help='base URL of a running server (default: in-process)')
+    run_parser.add_argument('--baseline', help='baseline JSON to compare against')
+    run_parser.add_argument('--save-baseline', help='write this run as a baseline JSON')
+    run_parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95/throughput drift')
+    run_parser.add_argument('--seed', type=int, default=42)
+
+    commands.add_parser('cleanup', help='remove the synthetic dataset')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'cleanup':
+        run_cleanup(args)
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == '__main__':
+    main()
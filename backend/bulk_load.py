@@ -0,0 +1,138 @@
+"""
+Bulk CSV loader using COPY FROM STDIN
+
+Each CSV is streamed straight from disk into a temporary staging table
+with COPY (no per-row round trips, no pandas, flat client memory) and
+then merged into the real table with one INSERT ... SELECT. Existing
+rows are kept (ON CONFLICT DO NOTHING) and rows whose parent row is
+missing (an order for an unknown user, a cart line for a deleted
+product) are skipped instead of aborting the load.
+
+Usage:
+    python bulk_load.py [--data-dir data] [users admin products orders order_items cart]
+"""
+import argparse
+import logging
+import time
+from pathlib import Path
+import psycopg2
+from db import get_db_config
+from rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / 'data'
+
+# Load order matters: parents before children.
+# name -> (csv file, staging columns in CSV order, merge statement)
+TABLES = {
+    'users': ('users.csv', ('email', 'password'), """
+        INSERT INTO users (email, password)
+        SELECT email, password FROM {stage}
+        ON CONFLICT (email) DO NOTHING
+    """),
+    'admin': ('admin.csv', ('email', 'password'), """
+        INSERT INTO admins (email, password)
+        SELECT email, password FROM {stage}
+        ON CONFLICT (email) DO NOTHING
+    """),
+    'products': ('products.csv', ('id', 'name', 'price', 'stock', 'image'), """
+        INSERT INTO products (id, name, price, stock, image)
+        SELECT id::int, name, price::numeric, stock::numeric::int, NULLIF(image, '')
+        FROM {stage}
+        ON CONFLICT (id) DO NOTHING
+    """),
+    'orders': ('orders.csv', ('order_id', 'email', 'amount', 'date'), """
+        INSERT INTO orders (order_id, email, amount, date)
+        SELECT s.order_id, s.email, s.amount::numeric, s.date::date
+        FROM {stage} s
+        JOIN users u ON u.email = s.email
+        ON CONFLICT (order_id) DO NOTHING
+    """),
+    # order_items has no natural key, so re-loading skips (order, product) pairs already present
+    'order_items': ('order_items.csv', ('order_id', 'product_id', 'quantity', 'price_at_purchase'), """
+        INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase)
+        SELECT s.order_id, s.product_id::int, s.quantity::int, s.price_at_purchase::numeric
+        FROM {stage} s
+        JOIN orders o ON o.order_id = s.order_id
+        JOIN products p ON p.id = s.product_id::int
+        WHERE NOT EXISTS (
+            SELECT 1 FROM order_items oi
+            WHERE oi.order_id = s.order_id AND oi.product_id = s.product_id::int
+        )
+    """),
+    'cart': ('cart.csv', ('email', 'product_id', 'quantity'), """
+        INSERT INTO cart (email, product_id, quantity)
+        SELECT s.email, s.product_id::int, s.quantity::int
+        FROM {stage} s
+        JOIN users u ON u.email = s.email
+        JOIN products p ON p.id = s.product_id::int
+        ON CONFLICT (email, product_id) DO NOTHING
+    """),
+}
+
+
+def _check_header(csv_path, columns):
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        header = [h.strip().lower() for h in f.readline().strip().split(',')]
+    if header != list(columns):
+        raise ValueError(f"{csv_path.name}: expected columns {', '.join(columns)}, got {', '.join(header)}")
+
+
+def load_table(cursor, name, data_dir=DATA_DIR):
+    """COPY one CSV into staging and merge it. Returns (rows read, rows inserted) or None if absent."""
+    csv_file, columns, merge_sql = TABLES[name]
+    csv_path = Path(data_dir) / csv_file
+    if not csv_path.exists():
+        return None
+    _check_header(csv_path, columns)
+
+    stage = f"stage_{name}"
+    start = time.perf_counter()
+    cursor.execute(f"CREATE TEMP TABLE {stage} ({', '.join(f'{c} TEXT' for c in columns)})")
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        cursor.copy_expert(f"COPY {stage} FROM STDIN WITH (FORMAT csv, HEADER true)", f, size=1 << 20)
+    rows_read = cursor.rowcount
+    cursor.execute(merge_sql.format(stage=stage))
+    rows_inserted = cursor.rowcount
+    cursor.execute(f"DROP TABLE {stage}")
+    elapsed = time.perf_counter() - start
+
+    rate = rows_read / elapsed if elapsed > 0 else 0
+    logger.info(f"{name}: {rows_read} rows read, {rows_inserted} inserted in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return rows_read, rows_inserted
+
+
+def load_all(cursor, tables=None, data_dir=DATA_DIR):
+    """Load the given tables (default: all) in dependency order and rebuild analytics rollups"""
+    selected = [name for name in TABLES if tables is None or name in tables]
+    results = {name: load_table(cursor, name, data_dir) for name in selected}
+    if {'orders', 'order_items'} & set(selected):
+        rebuild_rollups(cursor)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('tables', nargs='*', help=f"tables to load (default: all of {', '.join(TABLES)})")
+    parser.add_argument('--data-dir', default=str(DATA_DIR))
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cursor = conn.cursor()
+        load_all(cursor, args.tables or None, args.data_dir)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
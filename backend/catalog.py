@@ -0,0 +1,138 @@
+"""
+Product catalog reads with an in-process read-through cache
+"""
+import os
+import re
+from flask import Response
+from cache import TTLCache
+from db import get_db_cursor
+import statements
+from pagination import PageRequest, paginate, project, set_next_cursor
+from serialization import dumps
+
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv('CATALOG_CACHE_SIZE', '64')),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', '300'))
+)
+
+# (normalized search query, fields) -> serialized result body
+search_cache = TTLCache(
+    maxsize=int(os.getenv('SEARCH_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', '300'))
+)
+
+PRODUCT_FIELDS = ('ID', 'name', 'price', 'stock', 'image')
+# Catalog pages are ordered by id
+PRODUCT_CURSOR = (int,)
+
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', '100'))
+SEARCH_SIMILARITY = float(os.getenv('SEARCH_SIMILARITY', '0.4'))
+
+# Both WHERE branches are served by idx_products_name_trgm. Results are
+# ranked exact match, then prefix, then substring, then fuzzy (typo) matches.
+# The threshold is set in the same round trip as the query.
+SEARCH_SQL = """
+    SET LOCAL pg_trgm.word_similarity_threshold = %(threshold)s;
+    SELECT id, name, price, stock, image
+    FROM products
+    WHERE name ILIKE %(pattern)s OR %(query)s <%% name
+    ORDER BY
+        CASE
+            WHEN LOWER(name) = %(query)s THEN 0
+            WHEN name ILIKE %(prefix)s THEN 1
+            WHEN name ILIKE %(pattern)s THEN 2
+            ELSE 3
+        END,
+        word_similarity(%(query)s, name) DESC,
+        name,
+        id
+    LIMIT %(limit)s
+"""
+
+
+def invalidate_catalog():
+    """Drop cached catalog bodies. Call after any write to products.
+
+    Only this process's caches are dropped; other worker processes serve
+    their copy until CATALOG_CACHE_TTL runs out.
+    """
+    catalog_cache.invalidate()
+    search_cache.invalidate()
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so equivalent searches share a cache entry"""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _product_dict(row):
+    return {
+        'ID': int(row['id']),
+        'name': row['name'],
+        'price': float(row['price']),
+        'stock': int(row['stock']),
+        'image': row['image']
+    }
+
+
+def _fetch_products(page):
+    with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
+        if page.paginated:
+            after_id = page.after[0] if page.after else 0
+            statements.execute(cursor, 'catalog_page', (after_id, page.limit + 1))
+        else:
+            statements.execute(cursor, 'catalog_all')
+        return [_product_dict(row) for row in cursor.fetchall()]
+
+
+def search_products(cursor, query, limit=SEARCH_LIMIT):
+    """Run the ranked product search for an already normalized query"""
+    escaped = _escape_like(query)
+    cursor.execute(SEARCH_SQL, {
+        'threshold': SEARCH_SIMILARITY,
+        'query': query,
+        'pattern': f'%{escaped}%',
+        'prefix': f'{escaped}%',
+        'limit': limit
+    })
+    return [_product_dict(row) for row in cursor.fetchall()]
+
+
+def catalog_response(page=None):
+    """Return the catalog (or one page of it) as a JSON response, serving the cached body when possible"""
+    page = page or PageRequest()
+    key = page.cache_key()
+    cached = catalog_cache.get(key)
+    if cached is None:
+        generation = catalog_cache.generation
+        items, next_cursor = paginate(_fetch_products(page), page, lambda item: [item['ID']])
+        cached = (dumps(items), next_cursor)
+        catalog_cache.set(key, cached, generation)
+    body, next_cursor = cached
+    return set_next_cursor(Response(body, mimetype='application/json'), next_cursor)
+
+
+def search_response(query, fields=None):
+    """Return ranked search results as a JSON response, cached per normalized query.
+
+    Search results are ranked rather than keyset ordered, so only field
+    projection applies; the result size is bounded by SEARCH_LIMIT.
+    """
+    query = normalize_query(query)
+    if not query:
+        return catalog_response(PageRequest(fields=fields))
+
+    key = (query, tuple(fields) if fields else None)
+    body = search_cache.get(key)
+    if body is None:
+        generation = search_cache.generation
+        with get_db_cursor(dict_cursor=True, readonly=True) as (cursor, conn):
+            result = search_products(cursor, query)
+            conn.commit()
+        body = dumps([project(item, fields) for item in result])
+        search_cache.set(key, body, generation)
+    return Response(body, mimetype='application/json')
@@ -4,18 +4,383 @@ Database connection and utility functions for PostgreSQL
 from dotenv import load_dotenv
 load_dotenv()
 import psycopg2
-from psycopg2 import pool, extras
+from psycopg2 import pool, extras, extensions
 from psycopg2.extras import RealDictCursor
 import os
+import random
+import threading
+import time
 from contextlib import contextmanager
 from typing import Optional, List, Dict, Any
 import logging
+from logging.handlers import RotatingFileHandler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Callbacks run after every statement on a pooled connection:
+# listener(cursor, query, params, seconds). Used for metrics and profiling.
+statement_listeners = []
+
+
+def add_statement_listener(listener):
+    if listener not in statement_listeners:
+        statement_listeners.append(listener)
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        if not statement_listeners:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in statement_listeners:
+                try:
+                    listener(self, query, vars, elapsed)
+                except Exception as e:
+                    logger.debug(f"Statement listener failed: {e}")
+
+
+class TimedCursor(_TimedCursorMixin, extensions.cursor):
+    """Default cursor of pooled connections; reports each statement to statement_listeners"""
+
+
+class TimedDictCursor(_TimedCursorMixin, RealDictCursor):
+    """RealDictCursor that reports each statement to statement_listeners"""
+
+
+# ============= SLOW QUERY LOG =============
+#
+# Opt-in with DB_SLOW_QUERY_MS. Every statement slower than the threshold
+# is logged with the endpoint that ran it; for a DB_SLOW_QUERY_SAMPLE
+# fraction of those that are plain SELECTs, EXPLAIN (ANALYZE, BUFFERS) is
+# run again on a fresh cursor inside a savepoint and the plan is logged
+# too. Output goes to a rotating file (DB_SLOW_QUERY_LOG).
+#
+# The plan re-executes the query, so it costs the slow query's time again
+# on a sampled request; keep the sample rate low in production. Logged SQL
+# and plans contain parameter values.
+
+slow_query_logger = logging.getLogger('slow_queries')
+_explaining = threading.local()
+
+_EXPLAIN_PREFIX = ('select', 'with', 'table', 'values')
+
+
+def get_slow_query_config():
+    """Slow query log settings, or None when DB_SLOW_QUERY_MS is not set"""
+    threshold = os.getenv('DB_SLOW_QUERY_MS')
+    if not threshold:
+        return None
+    return {
+        'threshold': float(threshold) / 1000,
+        'sample': float(os.getenv('DB_SLOW_QUERY_SAMPLE', '0.1')),
+        'path': os.getenv('DB_SLOW_QUERY_LOG', os.path.join(os.path.dirname(__file__), 'logs', 'slow_queries.log')),
+        'max_bytes': int(os.getenv('DB_SLOW_QUERY_LOG_BYTES', str(10 * 1024 * 1024))),
+        'backups': int(os.getenv('DB_SLOW_QUERY_LOG_BACKUPS', '5')),
+    }
+
+
+def _current_endpoint():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if has_request_context():
+        return f"{request.method} {request.endpoint or request.path}"
+    return None
+
+
+def _explainable(cursor, query):
+    """Only single read-only statements are re-run under EXPLAIN ANALYZE"""
+    if not isinstance(query, str) or getattr(cursor, 'name', None):
+        return None
+    text = query.strip().rstrip(';')
+    if ';' in text or ' for update' in text.lower() or ' for share' in text.lower():
+        return None
+    lowered = text.lower()
+    if lowered.startswith('execute '):
+        # Prepared statement: look at the statement it runs
+        import statements
+        name = lowered.split()[1].split('(')[0]
+        prepared = statements.STATEMENTS.get(name, '').strip().lower()
+        if not prepared.startswith('select') or ' for update' in prepared:
+            return None
+        return text
+    if not lowered.startswith(_EXPLAIN_PREFIX):
+        return None
+    if lowered.startswith('with') and any(word in lowered for word in ('insert ', 'update ', 'delete ')):
+        return None
+    return text
+
+
+def _explain(cursor, query, params):
+    conn = cursor.connection
+    if conn.closed or conn.info.transaction_status != extensions.TRANSACTION_STATUS_INTRANS:
+        return None
+    _explaining.active = True
+    try:
+        with conn.cursor() as explain_cursor:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+                plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+                return plan
+            except psycopg2.Error as e:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                return f"(EXPLAIN failed: {e})"
+    finally:
+        _explaining.active = False
+
+
+def _log_slow_query(cursor, query, params, seconds):
+    if seconds < _slow_query_config['threshold'] or getattr(_explaining, 'active', False):
+        return
+    sql = query if isinstance(query, str) else repr(query)
+    endpoint = _current_endpoint() or 'background'
+    message = f"{seconds * 1000:.1f} ms [{endpoint}] {' '.join(sql.split())}"
+    explainable = _explainable(cursor, query)
+    if explainable and random.random() < _slow_query_config['sample']:
+        plan = _explain(cursor, explainable, params)
+        if plan:
+            message += "\n" + plan
+    slow_query_logger.warning(message)
+
+
+def enable_slow_query_log(config=None):
+    """Start logging slow statements (called at import when DB_SLOW_QUERY_MS is set)"""
+    global _slow_query_config
+    config = config or get_slow_query_config()
+    if config is None:
+        return
+    _slow_query_config = config
+    os.makedirs(os.path.dirname(config['path']) or '.', exist_ok=True)
+    handler = RotatingFileHandler(config['path'], maxBytes=config['max_bytes'], backupCount=config['backups'])
+    handler.setFormatter(logging.Formatter('%(asctime)s %(process)d %(message)s'))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+    add_statement_listener(_log_slow_query)
+    logger.info(
+        f"Logging statements slower than {config['threshold'] * 1000:g} ms to {config['path']}"
+    )
+
+
+_slow_query_config = None
+
+
 # Connection pool
-connection_pool: Optional[pool.ThreadedConnectionPool] = None
+connection_pool: Optional["BlockingConnectionPool"] = None
+_pool_lock = threading.Lock()
+
+# Pools copied from a parent process by fork(); see reset_after_fork()
+_inherited = []
+
+# Optional read replica (DB_REPLICA_HOST), used by readonly=True cursors
+replica_pool: Optional["BlockingConnectionPool"] = None
+_replica_lock = threading.Lock()
+_replica_state = {
+    'down_until': 0.0,   # monotonic time before which the replica is not retried
+    'checked_at': None,  # when replay position and lag were last read
+    'replay_lsn': 0,
+    'lag': 0.0,
+}
+_routing = dict.fromkeys(('replica', 'fallback_down', 'fallback_busy', 'fallback_stale'), 0)
+# Highest primary WAL position written by this process (see record_write_lsn)
+_write_lsn = 0
+
+
+class PoolTimeout(pool.PoolError):
+    """No connection became free within the checkout timeout"""
+
+
+class BlockingConnectionPool:
+    """Thread-safe connection pool that waits for a free connection.
+
+    psycopg2's ThreadedConnectionPool raises as soon as maxconn connections
+    are checked out and closes every connection returned above minconn.
+    This pool keeps up to maxconn connections open, makes callers wait up to
+    `timeout` seconds for one to come back, pings connections that sat idle
+    longer than `ping_after` seconds before handing them out, and replaces
+    connections older than `max_age` seconds when they are returned.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10.0, max_age=1800.0, ping_after=30.0, **connect_kwargs):
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            raise ValueError("pool size must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.minconn = int(minconn)
+        self.maxconn = int(maxconn)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.closed = False
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, created_at, returned_at)], most recently returned last
+        self._in_use = {}        # id(conn) -> created_at
+        self._size = 0           # idle + in use + being opened
+        self._waiting = 0
+        self._counters = dict.fromkeys(
+            ('checkouts', 'exhausted', 'timeouts', 'created', 'recycled', 'discarded'), 0
+        )
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(self.minconn):
+            conn = self._open()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(cursor_factory=TimedCursor, **self._connect_kwargs)
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._size += 1
+            self._counters['created'] += 1
+        return conn
+
+    def _discard(self, conn, counter='discarded'):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters[counter] += 1
+            self._cond.notify()
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` (default: the pool timeout) seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            with self._cond:
+                waited = False
+                while True:
+                    if self.closed:
+                        raise pool.PoolError("connection pool is closed")
+                    if self._idle or self._size < self.maxconn:
+                        break
+                    if not waited:
+                        self._counters['exhausted'] += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"no database connection available within {timeout:g}s "
+                            f"({self.maxconn} in use)"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                else:
+                    conn = None
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+                with self._cond:
+                    self._counters['created'] += 1
+            elif not self._healthy(conn, returned_at):
+                logger.warning("Discarding broken database connection")
+                self._discard(conn)
+                continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._in_use[id(conn)] = created_at
+                self._counters['checkouts'] += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection. Open transactions are rolled back; old or broken connections are closed."""
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            raise pool.PoolError("trying to put unkeyed connection")
+
+        if self.closed or close or conn.closed:
+            self._discard(conn)
+            return
+        if time.monotonic() - created_at > self.max_age:
+            self._discard(conn, 'recycled')
+            return
+
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._discard(conn)
+            return
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close idle connections now; checked-out ones are closed when they are returned"""
+        with self._cond:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Point-in-time counters for monitoring pool saturation"""
+        with self._cond:
+            checkouts = self._counters['checkouts']
+            return {
+                'min': self.minconn,
+                'max': self.maxconn,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiting': self._waiting,
+                **self._counters,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+                'wait_seconds_avg': round(self._wait_total / checkouts, 6) if checkouts else 0.0,
+            }
 
 
 def get_db_config():
@@ -29,25 +394,237 @@ def get_db_config():
     }
 
 
-def init_db_pool(min_conn=1, max_conn=10):
-    """Initialize the connection pool"""
+def get_pool_config():
+    """Get connection pool sizing and timeouts from environment variables.
+
+    The pool is per process: workers * DB_POOL_MAX must stay below the
+    server's max_connections.
+    """
+    return {
+        'minconn': int(os.getenv('DB_POOL_MIN', '1')),
+        'maxconn': int(os.getenv('DB_POOL_MAX', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'max_age': float(os.getenv('DB_POOL_MAX_AGE', '1800')),
+        'ping_after': float(os.getenv('DB_POOL_PING_AFTER', '30')),
+    }
+
+
+def init_db_pool(min_conn=None, max_conn=None):
+    """Initialize and return the connection pool (sizes default to DB_POOL_MIN / DB_POOL_MAX)"""
     global connection_pool
     try:
-        config = get_db_config()
-        connection_pool = pool.ThreadedConnectionPool(
-            min_conn, max_conn,
-            host=config['host'],
-            port=config['port'],
-            database=config['database'],
-            user=config['user'],
-            password=config['password']
+        pool_config = get_pool_config()
+        if min_conn is not None:
+            pool_config['minconn'] = min_conn
+        if max_conn is not None:
+            pool_config['maxconn'] = max_conn
+        connection_pool = BlockingConnectionPool(**pool_config, **get_db_config())
+        logger.info(
+            f"Database connection pool initialized successfully "
+            f"({pool_config['minconn']}-{pool_config['maxconn']} connections)"
         )
-        logger.info("Database connection pool initialized successfully")
+        return connection_pool
     except Exception as e:
         logger.error(f"Error initializing connection pool: {e}")
         raise
 
 
+def get_db_pool():
+    """Return the primary pool, creating it on first use"""
+    if connection_pool is None:
+        with _pool_lock:
+            if connection_pool is None:
+                init_db_pool()
+    return connection_pool
+
+
+def reset_after_fork():
+    """Forget pools inherited from the parent process; call first thing in a forked child.
+
+    Inherited connections share their sockets with the parent, so the child
+    must neither use nor close them (closing sends a terminate message on
+    the parent's session). They are parked in _inherited so they are never
+    garbage collected, and the child opens its own pools on first use.
+    """
+    global connection_pool, replica_pool, _pool_lock, _replica_lock
+    _inherited.extend(p for p in (connection_pool, replica_pool) if p is not None)
+    connection_pool = None
+    replica_pool = None
+    # A lock held by another thread at fork time would never be released here
+    _pool_lock = threading.Lock()
+    _replica_lock = threading.Lock()
+
+
+def get_replica_config():
+    """Read replica connection settings, or None when DB_REPLICA_HOST is not set.
+
+    Unset DB_REPLICA_* values fall back to the primary's. Replica sessions
+    are read-only, so a write routed there by mistake fails loudly.
+    """
+    host = os.getenv('DB_REPLICA_HOST')
+    if not host:
+        return None
+    primary = get_db_config()
+    return {
+        'host': host,
+        'port': os.getenv('DB_REPLICA_PORT', primary['port']),
+        'database': os.getenv('DB_REPLICA_NAME', primary['database']),
+        'user': os.getenv('DB_REPLICA_USER', primary['user']),
+        'password': os.getenv('DB_REPLICA_PASSWORD', primary['password']),
+        'options': '-c default_transaction_read_only=on'
+    }
+
+
+def get_replica_settings():
+    """Routing knobs for readonly=True queries"""
+    return {
+        'max_staleness': float(os.getenv('DB_REPLICA_MAX_STALENESS', '5')),
+        'check_interval': float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '1')),
+        'retry_interval': float(os.getenv('DB_REPLICA_RETRY_INTERVAL', '30')),
+    }
+
+
+_replica_settings = get_replica_settings()
+
+
+def init_replica_pool():
+    """Initialize the replica pool (no connections are opened until the first read)"""
+    global replica_pool
+    pool_config = get_pool_config()
+    pool_config['minconn'] = 0
+    pool_config['maxconn'] = int(os.getenv('DB_REPLICA_POOL_MAX', str(pool_config['maxconn'])))
+    replica_pool = BlockingConnectionPool(**pool_config, **get_replica_config())
+    logger.info(f"Read replica pool initialized (up to {pool_config['maxconn']} connections)")
+
+
+def pool_stats(replica=False):
+    """Counters of the current process's primary (or replica) pool, or an empty dict before first use"""
+    if not replica:
+        current = connection_pool
+        return current.stats() if current is not None else {}
+    current = replica_pool
+    with _replica_lock:
+        stats = current.stats() if current is not None else {}
+        stats.update(_routing)
+        stats['lag_seconds'] = _replica_state['lag']
+        stats['down'] = _replica_state['down_until'] > time.monotonic()
+    return stats
+
+
+def _parse_lsn(text):
+    high, low = text.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def record_write_lsn(conn):
+    """Remember the primary's WAL position after a committed write.
+
+    Until the replica has replayed up to this position, readonly=True
+    queries from this process go to the primary, so a change is never
+    followed by a read (or a cache refill) that does not see it yet. A
+    no-op without a replica.
+    """
+    global _write_lsn
+    if get_replica_config() is None:
+        return
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = _parse_lsn(cursor.fetchone()[0])
+        conn.rollback()
+    except psycopg2.Error as e:
+        # The write is already committed; at worst a read shortly after it is stale
+        logger.warning(f"Could not read the primary WAL position: {e}")
+        return
+    with _replica_lock:
+        _write_lsn = max(_write_lsn, lsn)
+
+
+def _count_route(route):
+    with _replica_lock:
+        _routing[route] += 1
+
+
+def _mark_replica_down(error):
+    logger.warning(f"Read replica unavailable, using the primary: {error}")
+    with _replica_lock:
+        _replica_state['down_until'] = time.monotonic() + _replica_settings['retry_interval']
+        _replica_state['checked_at'] = None
+    _count_route('fallback_down')
+
+
+def _replica_fresh(conn, max_staleness):
+    """Whether the replica has replayed this process's writes and lags at most max_staleness seconds.
+
+    The replay position is read at most every DB_REPLICA_CHECK_INTERVAL
+    seconds, or sooner when this process has written past it.
+    """
+    now = time.monotonic()
+    with _replica_lock:
+        checked_at = _replica_state['checked_at']
+        replay_lsn = _replica_state['replay_lsn']
+        lag = _replica_state['lag']
+        needed = _write_lsn
+    if checked_at is None or now - checked_at > _replica_settings['check_interval'] or replay_lsn < needed:
+        with conn.cursor() as cursor:
+            # Lag is zero when everything received has been replayed; otherwise it is the age of
+            # the last replayed commit. On a server that is not a standby both positions are NULL.
+            cursor.execute("""
+                SELECT pg_last_wal_replay_lsn()::text,
+                       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                       END
+            """)
+            replay_text, lag = cursor.fetchone()
+        conn.rollback()
+        replay_lsn = _parse_lsn(replay_text) if replay_text else float('inf')
+        lag = float(lag or 0)
+        with _replica_lock:
+            _replica_state.update(checked_at=now, replay_lsn=replay_lsn, lag=lag)
+    return replay_lsn >= needed and lag <= max_staleness
+
+
+def _checkout_replica(max_staleness):
+    """Return (pool, connection) on the replica, or None when the primary should serve the read"""
+    global replica_pool
+    if get_replica_config() is None:
+        return None
+    with _replica_lock:
+        down = _replica_state['down_until'] > time.monotonic()
+    if down:
+        _count_route('fallback_down')
+        return None
+    if replica_pool is None:
+        with _pool_lock:
+            if replica_pool is None:
+                init_replica_pool()
+
+    current = replica_pool
+    try:
+        conn = current.getconn()
+    except PoolTimeout:
+        _count_route('fallback_busy')
+        return None
+    except psycopg2.Error as e:
+        _mark_replica_down(e)
+        return None
+
+    if max_staleness is None:
+        max_staleness = _replica_settings['max_staleness']
+    try:
+        fresh = _replica_fresh(conn, max_staleness)
+    except psycopg2.Error as e:
+        current.putconn(conn, close=True)
+        _mark_replica_down(e)
+        return None
+    if not fresh:
+        current.putconn(conn)
+        _count_route('fallback_stale')
+        return None
+    _count_route('replica')
+    return current, conn
+
+
 def create_database_if_not_exists():
     """Create the database if it doesn't exist"""
     config = get_db_config()
@@ -83,14 +660,23 @@ def create_database_if_not_exists():
 
 
 @contextmanager
-def get_db_connection():
-    """Get a database connection from the pool"""
-    if connection_pool is None:
-        init_db_pool()
-    
-    conn = None
+def get_db_connection(readonly=False, max_staleness=None):
+    """Get a database connection from the pool, waiting up to DB_POOL_TIMEOUT for one.
+
+    readonly=True routes the connection to the read replica when one is
+    configured, reachable, has replayed this process's writes and lags at
+    most `max_staleness` seconds (default DB_REPLICA_MAX_STALENESS);
+    otherwise the primary serves it.
+    """
+    checkout = _checkout_replica(max_staleness) if readonly else None
+    if checkout is not None:
+        current, conn = checkout
+    else:
+        current, conn = get_db_pool(), None
+
     try:
-        conn = connection_pool.getconn()
+        if conn is None:
+            conn = current.getconn()
         yield conn
     except Exception as e:
         if conn:
@@ -99,14 +685,14 @@ def get_db_connection():
         raise
     finally:
         if conn:
-            connection_pool.putconn(conn)
+            current.putconn(conn)
 
 
 @contextmanager
-def get_db_cursor(dict_cursor=False):
-    """Get a database cursor with optional dict cursor"""
-    with get_db_connection() as conn:
-        cursor_class = RealDictCursor if dict_cursor else None
+def get_db_cursor(dict_cursor=False, readonly=False, max_staleness=None):
+    """Get a database cursor with optional dict cursor, on the read replica if readonly"""
+    with get_db_connection(readonly, max_staleness) as conn:
+        cursor_class = TimedDictCursor if dict_cursor else None
         cursor = conn.cursor(cursor_factory=cursor_class)
         try:
             yield cursor, conn
@@ -114,9 +700,10 @@ def get_db_cursor(dict_cursor=False):
             cursor.close()
 
 
-def execute_query(query: str, params: tuple = None, fetch: bool = False, fetch_one: bool = False):
-    """Execute a query and optionally fetch results"""
-    with get_db_cursor(dict_cursor=fetch) as (cursor, conn):
+def execute_query(query: str, params: tuple = None, fetch: bool = False, fetch_one: bool = False,
+                  readonly: bool = False):
+    """Execute a query and optionally fetch results (on the read replica if readonly)"""
+    with get_db_cursor(dict_cursor=fetch, readonly=readonly) as (cursor, conn):
         cursor.execute(query, params)
         
         if fetch_one:
@@ -148,9 +735,16 @@ def execute_transaction(queries: List[tuple]):
 
 
 def close_db_pool():
-    """Close all connections in the pool"""
-    global connection_pool
+    """Close all connections in the pool (and the replica pool)"""
+    global connection_pool, replica_pool
     if connection_pool:
         connection_pool.closeall()
         connection_pool = None
         logger.info("Database connection pool closed")
+    if replica_pool:
+        replica_pool.closeall()
+        replica_pool = None
+
+
+if get_slow_query_config() is not None:
+    enable_slow_query_log()
@@ -1,163 +1,150 @@
 """
 Database initialization script
-Creates tables and migrates data from CSV if needed
+Applies versioned schema migrations and loads the CSV data if needed
+
+Migrations are the numbered files in migrations/ (0001_initial.sql,
+0002_....sql). Each one runs exactly once, in its own transaction together
+with its row in schema_migrations, so a database that is already current
+costs a single SELECT. The app itself never touches the schema; run this
+before starting it:
+
+    python db_init.py              # create database, migrate, load CSV data if empty
+    python db_init.py --no-seed    # migrations only
+    python db_init.py --status     # list applied and pending migrations
 """
+import argparse
 import psycopg2
-import psycopg2.extensions
-import pandas as pd
-import os
+import re
 import logging
-from db import get_db_config
+from db import get_db_config, create_database_if_not_exists
+from rollups import rebuild_if_missing
+from bulk_load import load_all
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def init_schema():
-    """Initialize database schema by reading schema.sql"""
-    schema_path = Path(__file__).parent / 'schema.sql'
-    
-    if not schema_path.exists():
-        logger.error("schema.sql not found!")
-        return False
-    
-    with open(schema_path, 'r', encoding='utf-8') as f:
-        schema_sql = f.read()
-    
-    config = get_db_config()
-    
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Arbitrary key for pg_advisory_lock so concurrent deploys don't migrate twice
+MIGRATION_LOCK_ID = 727400101
+
+
+def discover_migrations(migrations_dir=MIGRATIONS_DIR):
+    """Return [(version, name, path)] for every migration file, oldest first"""
+    migrations = []
+    for path in Path(migrations_dir).glob('*.sql'):
+        match = MIGRATION_FILE.match(path.name)
+        if not match:
+            logger.warning(f"Ignoring {path.name}: migration files are named NNNN_description.sql")
+            continue
+        migrations.append((int(match.group(1)), match.group(2), path))
+    migrations.sort()
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {migrations_dir}")
+    return migrations
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_migrations(migrations_dir=MIGRATIONS_DIR):
+    """Apply pending migrations. Returns the list of versions applied (empty when current)."""
+    migrations = discover_migrations(migrations_dir)
+    conn = psycopg2.connect(**get_db_config())
     try:
-        conn = psycopg2.connect(**config)
-        conn.autocommit = True
         cursor = conn.cursor()
-        
-        # Execute SQL script statement by statement
-        # Split by semicolon, but handle functions and triggers carefully
-        statements = []
-        current_statement = []
-        in_function = False
-        dollar_quote_count = 0
-        
-        lines = schema_sql.split('\n')
-        for line in lines:
-            # Skip comment lines
-            if line.strip().startswith('--'):
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        _ensure_migrations_table(cursor)
+        conn.commit()
+
+        done = applied_versions(cursor)
+        applied = []
+        for version, name, path in migrations:
+            if version in done:
                 continue
-            
-            current_statement.append(line)
-            
-            # Check for function definitions (using $$ delimiters)
-            dollar_quotes = line.count('$$')
-            dollar_quote_count += dollar_quotes
-            
-            # If we have an even number of $$, we're not in a function
-            if dollar_quote_count % 2 == 0:
-                in_function = False
-                # Check if line ends a statement
-                if line.strip().endswith(';') and not in_function:
-                    stmt = '\n'.join(current_statement).strip()
-                    if stmt:
-                        statements.append(stmt)
-                    current_statement = []
-            else:
-                in_function = True
-        
-        # Execute each statement
-        for stmt in statements:
-            try:
-                cursor.execute(stmt)
-            except psycopg2.Error as e:
-                # Ignore "already exists" errors (expected on subsequent runs)
-                error_msg = str(e).lower()
-                if 'already exists' not in error_msg and 'duplicate' not in error_msg:
-                    # Log but continue - some statements might fail if dependencies exist
-                    logger.debug(f"Schema statement note: {e}")
-        
-        cursor.close()
+            logger.info(f"Applying migration {version:04d}_{name}")
+            # The file goes to the server as one script: no client-side statement splitting,
+            # and it either applies completely or not at all
+            cursor.execute(path.read_text(encoding='utf-8'))
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            conn.commit()
+            applied.append(version)
+
+        if applied:
+            logger.info(f"Applied {len(applied)} migration(s)")
+        else:
+            logger.info("Database schema is up to date")
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def migration_status(migrations_dir=MIGRATIONS_DIR):
+    """Return [(version, name, applied)] for every known migration"""
+    migrations = discover_migrations(migrations_dir)
+    conn = psycopg2.connect(**get_db_config())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        done = applied_versions(cursor) if cursor.fetchone()[0] else set()
+        return [(version, name, version in done) for version, name, _ in migrations]
+    finally:
         conn.close()
-        
-        logger.info("Database schema initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error creating schema: {e}")
-        if 'conn' in locals():
-            conn.close()
-        return False
 
 
 def migrate_csv_data():
     """Migrate data from CSV files to PostgreSQL"""
     data_dir = Path(__file__).parent / 'data'
     config = get_db_config()
-    
+
     try:
         conn = psycopg2.connect(**config)
         cursor = conn.cursor()
-        
+
         # Check if data already exists
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        
-        if user_count > 0:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM users)")
+        has_users = cursor.fetchone()[0]
+
+        if has_users:
             logger.info("Data already exists in database. Skipping migration.")
+            rebuild_if_missing(cursor)
+            conn.commit()
             cursor.close()
             conn.close()
             return True
-        
-        # Migrate users
-        users_csv = data_dir / 'users.csv'
-        if users_csv.exists():
-            df = pd.read_csv(users_csv)
-            for _, row in df.iterrows():
-                cursor.execute(
-                    "INSERT INTO users (email, password) VALUES (%s, %s) ON CONFLICT (email) DO NOTHING",
-                    (row['email'], row['password'])
-                )
-            logger.info(f"Migrated {len(df)} users")
-        
-        # Migrate admins
-        admin_csv = data_dir / 'admin.csv'
-        if admin_csv.exists():
-            df = pd.read_csv(admin_csv)
-            for _, row in df.iterrows():
-                cursor.execute(
-                    "INSERT INTO admins (email, password) VALUES (%s, %s) ON CONFLICT (email) DO NOTHING",
-                    (row['email'], row['password'])
-                )
-            logger.info(f"Migrated {len(df)} admins")
-        
-        # Migrate products
-        products_csv = data_dir / 'products.csv'
-        if products_csv.exists():
-            df = pd.read_csv(products_csv)
-            for _, row in df.iterrows():
-                cursor.execute(
-                    "INSERT INTO products (id, name, price, stock, image) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (id) DO NOTHING",
-                    (int(row['ID']), row['name'], float(row['price']), int(row['stock']), row['image'])
-                )
-            logger.info(f"Migrated {len(df)} products")
-        
-        # Migrate orders
-        orders_csv = data_dir / 'orders.csv'
-        if orders_csv.exists():
-            df = pd.read_csv(orders_csv)
-            for _, row in df.iterrows():
-                cursor.execute(
-                    "INSERT INTO orders (order_id, email, amount, date) VALUES (%s, %s, %s, %s) ON CONFLICT (order_id) DO NOTHING",
-                    (str(row['order_id']), row['email'], float(row['amount']), row['date'])
-                )
-            logger.info(f"Migrated {len(df)} orders")
-        
-        # Note: Cart is not migrated as it's typically session-specific
-        # Orders don't have order_items in CSV, so we skip that
-        
+
+        # Stream every CSV through COPY and merge (also rebuilds analytics rollups)
+        load_all(cursor, data_dir=data_dir)
+
         conn.commit()
         cursor.close()
         conn.close()
-        
+
         logger.info("CSV data migration completed successfully")
         return True
-        
+
     except Exception as e:
         logger.error(f"Error migrating data: {e}")
         if 'conn' in locals():
@@ -166,15 +153,27 @@ def migrate_csv_data():
         return False
 
 
-if __name__ == '__main__':
-    from db import create_database_if_not_exists
-    
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--no-seed', action='store_true', help="apply migrations but don't load CSV data")
+    parser.add_argument('--status', action='store_true', help="list migrations and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        for version, name, applied in migration_status():
+            print(f"{version:04d}_{name}: {'applied' if applied else 'pending'}")
+        return
+
     logger.info("Initializing database...")
     create_database_if_not_exists()
-    
-    logger.info("Creating schema...")
-    if init_schema():
+
+    logger.info("Applying migrations...")
+    run_migrations()
+
+    if not args.no_seed:
         logger.info("Migrating CSV data...")
         migrate_csv_data()
-    else:
-        logger.error("Schema creation failed. Aborting migration.")
+
+
+if __name__ == '__main__':
+    main()
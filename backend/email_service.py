@@ -1,30 +1,294 @@
+"""
+Outgoing email through a transactional outbox
+
+Request handlers never talk to SMTP. They insert a row into email_outbox
+with the same cursor (and so the same transaction) as the change that
+triggers the mail, and a background worker drains the table over one
+reused SMTP connection, retrying with exponential backoff and moving
+messages that keep failing to the 'dead' state.
+
+Run the worker on its own with ``python email_service.py``. Point
+SMTP_HOST/SMTP_PORT at a local stand-in server (SMTP_USE_SSL=false) to
+test without a real mail provider, e.g.
+``python -m aiosmtpd -n -l localhost:1025``. SMTP_USER and SMTP_PASSWORD
+have no defaults and must be set (an empty password skips login).
+"""
+import os
 import smtplib
+import threading
+import time
+import logging
 from email.mime.text import MIMEText
+from db import get_db_cursor
+import metrics
+import statements
+
+logger = logging.getLogger(__name__)
+
+ORDER_SUBJECT = "Order Confirmation"
+RESET_SUBJECT = "Password Reset Code"
+
+
+def get_smtp_config():
+    """Get SMTP and outbox worker configuration from environment variables"""
+    return {
+        'host': os.getenv('SMTP_HOST', 'smtp.gmail.com'),
+        'port': int(os.getenv('SMTP_PORT', '465')),
+        'use_ssl': os.getenv('SMTP_USE_SSL', 'true').lower() in ('1', 'true', 'yes'),
+        # No defaults: None means unset, and the worker won't start without them
+        'user': os.getenv('SMTP_USER'),
+        'password': os.getenv('SMTP_PASSWORD'),
+        'sender': os.getenv('SMTP_SENDER') or os.getenv('SMTP_USER'),
+        'timeout': float(os.getenv('SMTP_TIMEOUT', '10')),
+        'batch_size': int(os.getenv('OUTBOX_BATCH_SIZE', '50')),
+        'poll_interval': float(os.getenv('OUTBOX_POLL_INTERVAL', '2')),
+        'max_attempts': int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8')),
+        'backoff_base': float(os.getenv('OUTBOX_BACKOFF_BASE', '30')),
+        'backoff_max': float(os.getenv('OUTBOX_BACKOFF_MAX', '3600')),
+        'lock_timeout': float(os.getenv('OUTBOX_LOCK_TIMEOUT', '300')),
+    }
+
+
+# ============= ENQUEUE (request path) =============
+
+def enqueue_email(cursor, to, subject, content):
+    """Queue a message using the caller's cursor. It is sent only if the caller commits."""
+    statements.execute(cursor, 'outbox_insert', (to, subject, content))
+
+
+def queue_order_confirmation(cursor, to, content):
+    enqueue_email(cursor, to, ORDER_SUBJECT, content)
+
+
+def queue_reset_code_email(cursor, to, code):
+    enqueue_email(cursor, to, RESET_SUBJECT, f"Your password reset code is: {code}")
+
+
+_wakeup = threading.Event()
+
+
+def notify_outbox():
+    """Wake the in-process worker after a commit instead of waiting for the next poll"""
+    _wakeup.set()
+
+
+# ============= DELIVERY (background) =============
+
+class PermanentSendError(Exception):
+    """The server rejected the message itself; retrying will not help"""
+
+
+def missing_smtp_settings(config):
+    """Names of required SMTP settings that are not set"""
+    return [name for name, key in (('SMTP_USER', 'user'), ('SMTP_PASSWORD', 'password')) if config[key] is None]
+
+
+class SMTPSender:
+    """Keeps one SMTP session open across messages and reconnects when it drops"""
+
+    def __init__(self, config):
+        self.config = config
+        self.server = None
+
+    def _connect(self):
+        config = self.config
+        if config['use_ssl']:
+            server = smtplib.SMTP_SSL(config['host'], config['port'], timeout=config['timeout'])
+        else:
+            server = smtplib.SMTP(config['host'], config['port'], timeout=config['timeout'])
+        if config['user'] and config['password']:
+            server.login(config['user'], config['password'])
+        return server
+
+    def _send(self, msg):
+        if self.server is None:
+            self.server = self._connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The provider dropped the idle session; reconnect once
+            self.server = self._connect()
+            self.server.send_message(msg)
+
+    def send(self, to, subject, content):
+        msg = MIMEText(content)
+        msg["Subject"] = subject
+        msg["From"] = self.config['sender']
+        msg["To"] = to
+
+        # Only a rejection of this message is permanent. Connect, login and
+        # sender errors (wrong credentials, provider down) are retried with
+        # backoff like any other transient failure.
+        try:
+            self._send(msg)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentSendError(str(e))
+        except smtplib.SMTPDataError as e:
+            if e.smtp_code >= 500:
+                raise PermanentSendError(f"{e.smtp_code} {e.smtp_error!r}")
+            self.close()
+            raise
+        except (smtplib.SMTPException, OSError):
+            self.close()
+            raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+def claim_batch(config):
+    """Mark a batch of due messages as 'sending' and return them.
+
+    SKIP LOCKED lets several workers drain the table side by side, and rows
+    stuck in 'sending' past the lock timeout (a crashed worker) are reclaimed.
+    """
+    with get_db_cursor() as (cursor, conn):
+        cursor.execute(
+            """UPDATE email_outbox
+               SET status = 'sending', attempts = attempts + 1, locked_at = CURRENT_TIMESTAMP
+               WHERE id IN (
+                   SELECT id FROM email_outbox
+                   WHERE (status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP)
+                      OR (status = 'sending' AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                   ORDER BY id
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING id, recipient, subject, body, attempts""",
+            (config['lock_timeout'], config['batch_size'])
+        )
+        batch = cursor.fetchall()
+        conn.commit()
+        return batch
+
+
+def record_results(config, sent, failed):
+    """Persist the outcome of a batch: sent ids and (id, attempts, error, permanent) failures"""
+    with get_db_cursor() as (cursor, conn):
+        if sent:
+            cursor.execute(
+                """UPDATE email_outbox
+                   SET status = 'sent', sent_at = CURRENT_TIMESTAMP, locked_at = NULL, last_error = NULL
+                   WHERE id = ANY(%s)""",
+                (sent,)
+            )
+        for message_id, attempts, error, permanent in failed:
+            if permanent or attempts >= config['max_attempts']:
+                cursor.execute(
+                    "UPDATE email_outbox SET status = 'dead', locked_at = NULL, last_error = %s WHERE id = %s",
+                    (error, message_id)
+                )
+            else:
+                delay = min(config['backoff_base'] * 2 ** (attempts - 1), config['backoff_max'])
+                cursor.execute(
+                    """UPDATE email_outbox
+                       SET status = 'pending', locked_at = NULL, last_error = %s,
+                           next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                       WHERE id = %s""",
+                    (error, delay, message_id)
+                )
+        conn.commit()
+
+
+def drain_once(sender, config):
+    """Send one batch. Returns the number of messages claimed."""
+    batch = claim_batch(config)
+    sent, failed = [], []
+    for message_id, recipient, subject, body, attempts in batch:
+        start = time.perf_counter()
+        try:
+            sender.send(recipient, subject, body)
+            sent.append(message_id)
+            outcome = 'sent'
+        except PermanentSendError as e:
+            logger.error(f"Email {message_id} to {recipient} rejected: {e}")
+            failed.append((message_id, attempts, str(e), True))
+            outcome = 'rejected'
+        except Exception as e:
+            logger.warning(f"Email {message_id} to {recipient} failed (attempt {attempts}): {e}")
+            failed.append((message_id, attempts, str(e), False))
+            outcome = 'failed'
+        metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - start, outcome)
+    if batch:
+        record_results(config, sent, failed)
+    return len(batch)
+
+
+class OutboxWorker(threading.Thread):
+    """Background thread that drains email_outbox until stopped"""
+
+    def __init__(self, config=None):
+        super().__init__(name='email-outbox', daemon=True)
+        self.config = config or get_smtp_config()
+        self.sender = SMTPSender(self.config)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        logger.info("Email outbox worker started")
+        while not self._stop_event.is_set():
+            try:
+                claimed = drain_once(self.sender, self.config)
+            except Exception as e:
+                logger.error(f"Email outbox worker error: {e}")
+                claimed = 0
+            if claimed == 0:
+                # Nothing queued: don't hold an idle session open
+                self.sender.close()
+            # A full batch means there is probably more waiting
+            if claimed < self.config['batch_size']:
+                _wakeup.wait(self.config['poll_interval'])
+                _wakeup.clear()
+        self.sender.close()
+        logger.info("Email outbox worker stopped")
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_outbox_worker():
+    """Start the in-process outbox worker once per process.
+
+    Returns None, leaving messages queued, when SMTP credentials are not configured.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            config = get_smtp_config()
+            missing = missing_smtp_settings(config)
+            if missing:
+                logger.error(f"Email outbox worker not started: set {' and '.join(missing)}")
+                return None
+            _worker = OutboxWorker(config)
+            _worker.start()
+        return _worker
+
+
+def stop_outbox_worker(timeout=10):
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker.join(timeout)
+            _worker = None
+
 
-def send_email(to, content):
-    sender_email = "samikshasubash22@gmail.com"
-    sender_password = "thtn qogf oolu izsl"  
-    msg = MIMEText(content)
-    msg["Subject"] = "Order Confirmation"
-    msg["From"] = sender_email
-    msg["To"] = to
-
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-
-def send_reset_code_email(to, code):
-    sender_email = "samikshasubash22@gmail.com"
-    sender_password = "thtn qogf oolu izsl"  
-
-    subject = "Password Reset Code"
-    content = f"Your password reset code is: {code}"
-
-    msg = MIMEText(content)
-    msg["Subject"] = subject
-    msg["From"] = sender_email
-    msg["To"] = to
-
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
\ No newline at end of file
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    worker = start_outbox_worker()
+    if worker is None:
+        raise SystemExit(1)
+    try:
+        while worker.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_outbox_worker()
@@ -0,0 +1,74 @@
+"""
+Gunicorn settings for production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app), which does no
+database I/O, and forked into the workers. Each worker then drops
+anything it inherited, opens its own connection pool and warms it up
+before it accepts a request, and closes the pool when it exits.
+"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# .env must be read before the defaults below, or they would take precedence
+load_dotenv()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threads overlap the database waits of one worker's requests
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+# In-flight requests get this long to finish on shutdown or reload
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+
+# Run the email outbox worker in every process (claims use SKIP LOCKED, so
+# they never send the same message twice). Set to false and run
+# `python email_service.py` on its own instead if you prefer.
+outbox_in_workers = os.getenv('OUTBOX_WORKER', 'true').lower() in ('1', 'true', 'yes')
+
+# One pooled connection per request thread, plus one for the outbox worker,
+# all opened during warm-up
+os.environ.setdefault('DB_POOL_MAX', str(threads + (1 if outbox_in_workers else 0)))
+os.environ.setdefault('DB_POOL_MIN', str(threads))
+
+# The catalog, search and analytics caches live in each worker, and a write
+# only invalidates them in the worker that handled it. With several workers
+# keep their TTLs short so the others catch up within a few seconds.
+if workers > 1:
+    os.environ.setdefault('CATALOG_CACHE_TTL', os.getenv('MULTI_WORKER_CACHE_TTL', '5'))
+    os.environ.setdefault('ANALYTICS_CACHE_TTL', os.getenv('MULTI_WORKER_CACHE_TTL', '5'))
+
+
+def when_ready(server):
+    total = workers * int(os.environ['DB_POOL_MAX'])
+    server.log.info(f"{workers} workers x {threads} threads; up to {total} PostgreSQL connections "
+                    f"(keep below the server's max_connections)")
+
+
+def post_fork(server, worker):
+    import db
+    db.reset_after_fork()
+
+
+def post_worker_init(worker):
+    # Runs in the worker after the app is loaded and before it accepts connections
+    from app import warm_up
+    warm_up(worker.wsgi)
+    if outbox_in_workers:
+        from email_service import start_outbox_worker
+        start_outbox_worker()
+
+
+def worker_exit(server, worker):
+    from db import close_db_pool
+    from email_service import stop_outbox_worker
+    stop_outbox_worker()
+    close_db_pool()
@@ -0,0 +1,240 @@
+"""
+Product image storage, resized variants and cacheable serving
+
+Uploads are stored under the SHA-256 of their content
+(static/images/<hash>.<ext>), so two products can never overwrite each
+other's image and re-uploading the same photo reuses the existing file.
+Because a stored file never changes, it is served with a year-long
+immutable Cache-Control.
+
+Resized variants (thumb, card, full; plus WebP copies) are written to
+static/images/<size>/ by a background thread after the upload, never on
+the request path. They need Pillow; without it, or until a variant
+exists, the original is served instead with a short cache lifetime.
+Pillow is imported by the variant job, not when the app is imported.
+Variants for images that predate this module can be generated with:
+
+    python images.py
+"""
+import functools
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from flask import abort, request, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = Path(__file__).parent / 'static' / 'images'
+
+# name -> longest side in pixels
+VARIANTS = {
+    'thumb': 160,
+    'card': 400,
+    'full': 1200,
+}
+
+MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_MB', '10')) * 1024 * 1024
+WEBP_ENABLED = os.getenv('IMAGE_WEBP', 'true').lower() in ('1', 'true', 'yes')
+WEBP_QUALITY = int(os.getenv('IMAGE_WEBP_QUALITY', '80'))
+JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Legacy (non-hashed) names and fallbacks may still change
+SHORT_MAX_AGE = 300
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{32}\.(jpg|png|gif|webp)$')
+
+# magic bytes -> extension
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+_executor = None
+
+
+def _background():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('IMAGE_WORKERS', '2')),
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+@functools.lru_cache(maxsize=None)
+def pillow_available():
+    """Whether Pillow can be imported, checked without importing it"""
+    return importlib.util.find_spec('PIL') is not None
+
+
+def detect_type(data):
+    """Return the file extension for supported image bytes, or None"""
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_upload(file_storage):
+    """Store an uploaded image under its content hash and queue its variants.
+
+    Returns the stored file name. Raises ValueError for files that are too
+    large or not a supported image type.
+    """
+    data = file_storage.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    extension = detect_type(data)
+    if extension is None:
+        raise ValueError("Unsupported image type (use JPEG, PNG, GIF or WebP)")
+
+    filename = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+    path = IMAGE_DIR / filename
+    if not path.exists():
+        _write_atomic(path, data)
+    if pillow_available():
+        _background().submit(_generate_logged, filename)
+    return filename
+
+
+def _variant_names(filename):
+    stem, extension = os.path.splitext(filename)
+    # GIFs are resized to PNG (first frame only)
+    extension = '.png' if extension.lower() == '.gif' else extension.lower()
+    names = [stem + extension]
+    if WEBP_ENABLED and extension != '.webp':
+        names.append(stem + '.webp')
+    return names
+
+
+def generate_variants(filename, force=False):
+    """Write every missing resized variant of one stored image. Returns the number written."""
+    from PIL import Image, ImageOps, features
+
+    source = IMAGE_DIR / filename
+    written = 0
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        for size_name, longest in VARIANTS.items():
+            for variant in _variant_names(filename):
+                target = IMAGE_DIR / size_name / variant
+                if target.exists() and not force:
+                    continue
+                if variant.endswith('.webp') and not features.check('webp'):
+                    continue
+                image = original.copy()
+                # Never upscale: small originals are re-encoded at their own size
+                image.thumbnail((longest, longest), Image.LANCZOS)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.variant-')
+                os.close(fd)
+                try:
+                    if variant.endswith('.webp'):
+                        image.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+                    elif variant.endswith('.png'):
+                        image.save(tmp, 'PNG', optimize=True)
+                    else:
+                        image.convert('RGB').save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                    os.replace(tmp, target)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+                written += 1
+    return written
+
+
+def _generate_logged(filename):
+    try:
+        written = generate_variants(filename)
+        logger.info(f"Generated {written} image variants for {filename}")
+    except Exception as e:
+        logger.error(f"Could not generate variants for {filename}: {e}")
+
+
+def _safe_name(filename):
+    if '/' in filename or '\\' in filename or filename.startswith('.'):
+        abort(404)
+    return filename
+
+
+def image_response(filename, size=None):
+    """Serve an original image or one of its variants.
+
+    Responses support ETag/If-None-Match and Range requests. Content-hashed
+    files are immutable; a missing variant falls back to the original,
+    uncached, so the real variant is picked up once it has been generated.
+    """
+    filename = _safe_name(filename)
+    if size is not None and size not in VARIANTS:
+        abort(404)
+    if not (IMAGE_DIR / filename).is_file():
+        abort(404)
+
+    directory, served, variant = IMAGE_DIR, filename, False
+    if size is not None:
+        candidates = _variant_names(filename)
+        if request.accept_mimetypes['image/webp']:
+            candidates = candidates[::-1]
+        elif not filename.endswith('.webp'):
+            candidates = [c for c in candidates if not c.endswith('.webp')]
+        for candidate in candidates:
+            if (IMAGE_DIR / size / candidate).is_file():
+                directory, served, variant = IMAGE_DIR / size, candidate, True
+                break
+
+    immutable = bool(HASHED_NAME.match(filename)) and (size is None or variant)
+    response = send_from_directory(
+        directory, served,
+        max_age=IMMUTABLE_MAX_AGE if immutable else SHORT_MAX_AGE
+    )
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    elif size is not None and not variant:
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+    if size is not None:
+        response.vary.add('Accept')
+    return response
+
+
+def backfill():
+    """Generate missing variants for every stored original"""
+    if not pillow_available():
+        raise SystemExit("Pillow is not installed: pip install Pillow")
+    originals = [p.name for p in IMAGE_DIR.iterdir() if p.is_file() and detect_type(p.read_bytes()[:12])]
+    total = 0
+    for filename in sorted(originals):
+        try:
+            total += generate_variants(filename)
+        except Exception as e:
+            logger.error(f"{filename}: {e}")
+    logger.info(f"{total} variants written for {len(originals)} images")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    backfill()
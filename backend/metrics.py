@@ -0,0 +1,291 @@
+"""
+Request, database and email metrics in the Prometheus text format
+
+A deliberately small registry (counters and histograms with labels, plus
+callback gauges read at scrape time) so the app needs no extra
+dependency. init_app() wires it into Flask:
+
+- every request is timed per endpoint (`user.get_products`,
+  `admin.get_revenue_analytics`, ...);
+- every statement run on a pooled connection is counted and timed, and
+  the per-request totals are recorded, which makes N+1 query patterns
+  show up as a high db_statements_per_request;
+- pool state is read from db.pool_stats() when /metrics is scraped.
+
+Counters are per process. With several workers, scrape each one or
+aggregate in Prometheus.
+
+/metrics answers only clients in METRICS_ALLOW (addresses or networks,
+loopback by default) and requests carrying an admin token.
+"""
+import ipaddress
+import os
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from db import add_statement_listener, get_replica_config, pool_stats
+from tokens import require_auth
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(float(bound))}"')
+                yield f'{self.name}_bucket{labels} {count}'
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            yield f'{self.name}_bucket{labels} {series[-1]}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(series[-2])}'
+            yield f'{self.name}_count{labels} {series[-1]}'
+
+
+class GaugeCallback:
+    """Gauge whose samples are produced by a function at scrape time: fn() -> {label values: value}"""
+
+    def __init__(self, name, help_text, labels, fn, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn
+        self.kind = kind
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for label_values, value in sorted(self.fn().items()):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(line for metric in metrics for line in metric.collect()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint',
+    labels=('blueprint', 'endpoint', 'method')
+))
+REQUESTS = registry.register(Counter(
+    'http_requests_total', 'Requests by endpoint and status code',
+    labels=('blueprint', 'endpoint', 'method', 'status')
+))
+REQUEST_STATEMENTS = registry.register(Histogram(
+    'db_statements_per_request', 'SQL statements executed while handling one request',
+    labels=('endpoint',), buckets=STATEMENT_BUCKETS
+))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    'db_time_per_request_seconds', 'Time spent in SQL statements while handling one request',
+    labels=('endpoint',)
+))
+STATEMENT_SECONDS = registry.register(Histogram(
+    'db_statement_duration_seconds', 'Duration of individual SQL statements',
+    labels=('context',)
+))
+EMAIL_SEND_SECONDS = registry.register(Histogram(
+    'email_send_duration_seconds', 'Time to hand one message to the SMTP server',
+    labels=('outcome',)
+))
+
+
+def _pool_samples(key):
+    samples = {}
+    for name, replica in (('primary', False), ('replica', True)):
+        stats = pool_stats(replica=replica)
+        if key in stats:
+            samples[(name,)] = stats[key]
+    return samples
+
+
+def _pool_connections():
+    samples = {}
+    for name, replica in (('primary', False), ('replica', True)):
+        stats = pool_stats(replica=replica)
+        if 'idle' in stats:
+            samples[(name, 'idle')] = stats['idle']
+            samples[(name, 'in_use')] = stats['in_use']
+    return samples
+
+
+def _replica_routes():
+    if not get_replica_config():
+        return {}
+    stats = pool_stats(replica=True)
+    routes = ('replica', 'fallback_down', 'fallback_busy', 'fallback_stale')
+    return {(route,): stats[route] for route in routes if route in stats}
+
+
+registry.register(GaugeCallback(
+    'db_pool_connections', 'Open pooled connections by state', ('pool', 'state'), _pool_connections
+))
+registry.register(GaugeCallback(
+    'db_pool_max_connections', 'Pool size limit', ('pool',), lambda: _pool_samples('max')
+))
+registry.register(GaugeCallback(
+    'db_pool_waiting', 'Threads currently waiting for a connection', ('pool',), lambda: _pool_samples('waiting')
+))
+for _key, _help in (('checkouts', 'Connections handed out'),
+                    ('exhausted', 'Checkouts that had to wait because every connection was busy'),
+                    ('timeouts', 'Checkouts that gave up after the pool timeout'),
+                    ('created', 'Connections opened'),
+                    ('recycled', 'Connections closed for exceeding the maximum age'),
+                    ('discarded', 'Connections closed because they were broken or the pool closed')):
+    registry.register(GaugeCallback(
+        f'db_pool_{_key}_total', _help, ('pool',), lambda key=_key: _pool_samples(key), kind='counter'
+    ))
+registry.register(GaugeCallback(
+    'db_pool_wait_seconds_total', 'Total time spent waiting for a connection', ('pool',),
+    lambda: _pool_samples('wait_seconds_total'), kind='counter'
+))
+registry.register(GaugeCallback(
+    'db_replica_reads_total', 'Read-only checkouts by where they were served', ('route',), _replica_routes,
+    kind='counter'
+))
+registry.register(GaugeCallback(
+    'db_replica_lag_seconds', 'Replication lag seen at the last check', (),
+    lambda: {(): pool_stats(replica=True)['lag_seconds']} if get_replica_config() else {}
+))
+
+
+def _record_statement(cursor, query, params, seconds):
+    if has_request_context():
+        g._db_statements = g.get('_db_statements', 0) + 1
+        g._db_seconds = g.get('_db_seconds', 0.0) + seconds
+        context = request.endpoint or 'unmatched'
+    else:
+        context = 'background'
+    STATEMENT_SECONDS.observe(seconds, context)
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._db_statements = 0
+    g._db_seconds = 0.0
+
+
+def _after_request(response):
+    start = g.get('_metrics_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    blueprint = request.blueprint or 'app'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, blueprint, endpoint, request.method)
+    REQUESTS.inc(blueprint, endpoint, request.method, str(response.status_code))
+    REQUEST_STATEMENTS.observe(g.get('_db_statements', 0), endpoint)
+    REQUEST_DB_SECONDS.observe(g.get('_db_seconds', 0.0), endpoint)
+    return response
+
+
+# Networks allowed to scrape without a token, e.g. "127.0.0.1,::1,10.0.0.0/8"
+METRICS_ALLOW = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv('METRICS_ALLOW', '127.0.0.1,::1').split(',') if entry.strip()
+]
+
+
+def _scraper_allowed():
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in METRICS_ALLOW)
+
+
+def _render():
+    return Response(registry.render(), mimetype=CONTENT_TYPE)
+
+
+_render_for_admin = require_auth('admin')(_render)
+
+
+def metrics_view():
+    if _scraper_allowed():
+        return _render()
+    return _render_for_admin()
+
+
+def init_app(app, path='/metrics'):
+    """Time every request and expose the registry at `path`"""
+    add_statement_listener(_record_statement)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule(path, 'metrics', metrics_view)
@@ -1,9 +1,15 @@
 -- PostgreSQL Schema for Online Shopping Website
 -- This schema replaces CSV-based storage with proper relational database design
+--
+-- Migration 0001. Every statement is idempotent so databases created before
+-- versioned migrations existed can adopt it without errors.
 
 -- Enable UUID extension (for future use if needed)
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+-- Trigram matching for product search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
     email VARCHAR(255) PRIMARY KEY,
@@ -71,16 +77,60 @@ CREATE TABLE IF NOT EXISTS reset_codes (
     FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
 );
 
+-- Sales rollups for the admin analytics endpoints, maintained by rollups.py
+CREATE TABLE IF NOT EXISTS daily_sales (
+    date DATE PRIMARY KEY,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    order_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS product_sales (
+    product_id INTEGER PRIMARY KEY,
+    quantity_sold BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS customer_sales (
+    email VARCHAR(255) PRIMARY KEY,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+);
+
+-- Outgoing email, written in the same transaction as the change that triggers it
+-- and drained by the background worker in email_service.py
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',  -- pending | sending | sent | dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
 -- Indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_cart_email ON cart(email);
 CREATE INDEX IF NOT EXISTS idx_cart_product_id ON cart(product_id);
 CREATE INDEX IF NOT EXISTS idx_orders_email ON orders(email);
+-- Per-customer order history (newest first, keyset paginated)
+CREATE INDEX IF NOT EXISTS idx_orders_email_date ON orders(email, date, order_id);
 CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(date);
+-- Keyset pagination of /admin/orders (newest first)
+CREATE INDEX IF NOT EXISTS idx_orders_date_order_id ON orders(date, order_id);
 CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
 CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+-- Serves both ILIKE '%q%' and fuzzy (<%) product search
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_reset_codes_email ON reset_codes(email);
 CREATE INDEX IF NOT EXISTS idx_reset_codes_expires_at ON reset_codes(expires_at);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(next_attempt_at) WHERE status IN ('pending', 'sending');
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -92,6 +142,7 @@ END;
 $$ language 'plpgsql';
 
 -- Trigger to automatically update updated_at for products
+DROP TRIGGER IF EXISTS update_products_updated_at ON products;
 CREATE TRIGGER update_products_updated_at BEFORE UPDATE ON products
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
@@ -0,0 +1,11 @@
+-- Migration 0002. Order IDs come from a sequence instead of random 5-digit
+-- numbers picked in the application and checked for collisions.
+--
+-- New IDs start at 1000000000 (10 digits), so they can never collide with
+-- the existing 5-digit IDs, which stay valid. They increase with creation
+-- time, so new rows are appended at the right edge of the orders primary
+-- key index.
+
+CREATE SEQUENCE IF NOT EXISTS order_id_seq START WITH 1000000000 OWNED BY orders.order_id;
+
+ALTER TABLE orders ALTER COLUMN order_id SET DEFAULT nextval('order_id_seq')::text;
@@ -0,0 +1,137 @@
+"""
+Keyset (cursor) pagination and field projection for list endpoints
+
+List endpoints stay backwards compatible: without ``limit`` or ``after``
+they return the whole array as before. With them, the body is a single
+page and the cursor for the next page is sent in the ``X-Next-Cursor``
+header (absent on the last page). ``fields=a,b`` trims each item to the
+listed keys.
+
+Each endpoint declares the types of its sort key (``cursor_types``), so a
+cursor of the wrong shape is rejected with 400 instead of failing the
+query.
+"""
+import base64
+import datetime
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class PageRequest:
+    """Parsed ``limit`` / ``after`` / ``fields`` query parameters"""
+
+    def __init__(self, limit=None, after=None, after_token=None, fields=None):
+        self.limit = limit
+        self.after = after
+        self.after_token = after_token
+        self.fields = fields
+
+    @property
+    def paginated(self):
+        return self.limit is not None
+
+    def cache_key(self):
+        return (self.limit, self.after_token, tuple(self.fields) if self.fields else None)
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row as an opaque cursor"""
+    raw = json.dumps([str(v) if not isinstance(v, (int, float)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _cursor_value(value, kind):
+    if kind is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    elif kind is str:
+        if isinstance(value, str):
+            return value
+    elif kind is datetime.date:
+        if isinstance(value, str):
+            return datetime.date.fromisoformat(value)
+    raise ValueError('Invalid cursor')
+
+
+def decode_cursor(token, types=None):
+    """Decode a cursor. With ``types`` (int, str or datetime.date per sort
+    key column) its length and value types are checked and dates parsed."""
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    if types is not None:
+        if len(values) != len(types):
+            raise ValueError('Invalid cursor')
+        try:
+            values = [_cursor_value(value, kind) for value, kind in zip(values, types)]
+        except ValueError:
+            raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_page_args(args, allowed_fields, cursor_types=None):
+    """Build a PageRequest from request args. Raises ValueError on bad input.
+
+    ``cursor_types`` lists the type of each sort key column; ``after``
+    must match it.
+    """
+    limit = args.get('limit')
+    after_token = args.get('after')
+    fields = args.get('fields')
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    elif after_token:
+        limit = DEFAULT_PAGE_SIZE
+
+    after = decode_cursor(after_token, cursor_types) if after_token else None
+
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = None
+
+    return PageRequest(limit, after, after_token, fields)
+
+
+def project(item, fields):
+    if not fields:
+        return item
+    return {f: item[f] for f in fields if f in item}
+
+
+def paginate(items, page, sort_key):
+    """Trim a ``limit + 1`` fetch to one page and project it.
+
+    Returns the page items and the cursor for the next page, or None when
+    this is the last page. ``sort_key`` maps an unprojected item to the
+    values the query orders by.
+    """
+    next_cursor = None
+    if page.paginated and len(items) > page.limit:
+        items = items[:page.limit]
+        next_cursor = encode_cursor(sort_key(items[-1]))
+    return [project(item, page.fields) for item in items], next_cursor
+
+
+def set_next_cursor(response, next_cursor):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
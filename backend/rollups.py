@@ -0,0 +1,90 @@
+"""
+Incrementally maintained sales rollups for the admin analytics endpoints
+
+daily_sales, product_sales and customer_sales are updated inside the
+checkout transaction by record_order(), so the analytics endpoints read a
+handful of pre-aggregated rows instead of scanning every order ever
+placed. rebuild_rollups() recomputes them from orders/order_items and is
+the catch-up job after bulk loads or manual data fixes:
+
+    python rollups.py
+"""
+import logging
+import os
+from cache import TTLCache
+from db import get_db_cursor
+import statements
+
+logger = logging.getLogger(__name__)
+
+# Serialized /admin/analytics/* bodies. Dropped on every order, signup and
+# catalog change; the TTL bounds staleness for anything else.
+analytics_cache = TTLCache(
+    maxsize=32,
+    ttl=float(os.getenv('ANALYTICS_CACHE_TTL', '60'))
+)
+
+
+def invalidate_analytics():
+    analytics_cache.invalidate()
+
+
+def record_order(cursor, email, date, amount, product_ids, quantities, prices):
+    """Add one order to the rollups using the caller's cursor (one round trip).
+
+    Call it as the last statement before commit: the daily_sales row for
+    today is shared by every checkout, so its row lock should be held for
+    as short a time as possible.
+    """
+    statements.execute(
+        cursor, 'record_order',
+        (date, amount, email, list(product_ids), list(quantities), list(prices))
+    )
+
+
+def rebuild_rollups(cursor):
+    """Recompute every rollup table from orders and order_items"""
+    cursor.execute("LOCK TABLE daily_sales, product_sales, customer_sales IN EXCLUSIVE MODE")
+    cursor.execute("DELETE FROM daily_sales")
+    cursor.execute("""
+        INSERT INTO daily_sales (date, revenue, order_count)
+        SELECT date, SUM(amount), COUNT(*)
+        FROM orders
+        GROUP BY date
+    """)
+    cursor.execute("DELETE FROM product_sales")
+    cursor.execute("""
+        INSERT INTO product_sales (product_id, quantity_sold, revenue)
+        SELECT oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price_at_purchase)
+        FROM order_items oi
+        JOIN products p ON p.id = oi.product_id
+        GROUP BY oi.product_id
+    """)
+    cursor.execute("DELETE FROM customer_sales")
+    cursor.execute("""
+        INSERT INTO customer_sales (email, order_count, revenue)
+        SELECT o.email, COUNT(*), SUM(o.amount)
+        FROM orders o
+        JOIN users u ON u.email = o.email
+        GROUP BY o.email
+    """)
+
+
+def rebuild_if_missing(cursor):
+    """Backfill the rollups once for databases that had orders before they existed"""
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM orders) AND NOT EXISTS (SELECT 1 FROM daily_sales)")
+    if cursor.fetchone()[0]:
+        rebuild_rollups(cursor)
+        logger.info("Sales rollups backfilled from existing orders")
+
+
+def run_rebuild():
+    with get_db_cursor() as (cursor, conn):
+        rebuild_rollups(cursor)
+        conn.commit()
+    logger.info("Sales rollups rebuilt")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_rebuild()
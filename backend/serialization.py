@@ -0,0 +1,161 @@
+"""
+Fast JSON encoding and streamed JSON array responses
+
+dumps() uses orjson when it is installed and the standard library
+otherwise. Either way Decimal is written as a number and date/datetime in
+ISO 8601, so rows from the database can be encoded as they come from the
+cursor. FastJSONProvider plugs the same encoder into jsonify().
+
+query_batches() runs a SELECT on a server-side (named) cursor and hands
+out STREAM_BATCH_ROWS rows at a time; the *_chunks() encoders turn those
+batches into a JSON array, NDJSON or CSV body, optionally gzipped, so
+memory per request no longer grows with the size of the result.
+"""
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import zlib
+from decimal import Decimal
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+from db import TimedDictCursor, get_db_connection
+from pagination import project
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder is the fallback
+    orjson = None
+
+STREAM_BATCH_ROWS = int(os.getenv('STREAM_BATCH_ROWS', '1000'))
+
+_stream_names = itertools.count()
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj, indent=False):
+    """Encode to JSON bytes, keys sorted like jsonify()"""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(
+        obj, default=_default, sort_keys=True, ensure_ascii=False,
+        indent=2 if indent else None, separators=None if indent else (',', ':')
+    ).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through dumps(): faster, and Decimal/date aware"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(dumps(obj, indent=indent) + b'\n', mimetype=self.mimetype)
+
+
+def _row_batches(sql, params, readonly, offset):
+    with get_db_connection(readonly=readonly) as conn:
+        with conn.cursor(name=f'stream_{next(_stream_names)}', cursor_factory=TimedDictCursor) as cursor:
+            cursor.execute(sql, params)
+            if offset:
+                # MOVE on the server: skipped rows never reach this process
+                cursor.scroll(offset)
+            rows = cursor.fetchmany(STREAM_BATCH_ROWS)
+            # Pause here once: query_batches() runs the query up to this point
+            # before the response starts, so a failing query still raises
+            yield None
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(STREAM_BATCH_ROWS)
+        conn.commit()
+
+
+def query_batches(sql, params=None, offset=0, readonly=False):
+    """Run `sql` on a server-side cursor and return an iterator of row batches.
+
+    The query runs and the first batch is fetched before this returns, so
+    errors are raised here rather than halfway through a response. The
+    connection is held until the iterator is exhausted or closed. `offset`
+    skips that many rows on the server.
+    """
+    batches = _row_batches(sql, params, readonly, offset)
+    next(batches)
+    return batches
+
+
+# Encoders below close their source when they are closed, so a client that
+# disconnects mid-stream hands the connection back to the pool right away.
+
+def json_array_chunks(batches, fields=None):
+    try:
+        yield b'['
+        separator = b''
+        for rows in batches:
+            if fields:
+                rows = [project(row, fields) for row in rows]
+            yield separator + dumps(rows)[1:-1]
+            separator = b','
+        yield b']'
+    finally:
+        batches.close()
+
+
+def ndjson_chunks(batches):
+    try:
+        for rows in batches:
+            yield b''.join(dumps(row) + b'\n' for row in rows)
+    finally:
+        batches.close()
+
+
+def csv_chunks(batches, columns, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    try:
+        if header:
+            writer.writerow(columns)
+        for rows in batches:
+            writer.writerows([row[column] for column in columns] for row in rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    finally:
+        batches.close()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
+
+def stream_query(sql, params=None, fields=None, readonly=False):
+    """Run `sql` and return its rows as a chunked JSON array response.
+
+    Column names become the keys, optionally projected to `fields`. Raises
+    if the query fails.
+    """
+    batches = query_batches(sql, params, readonly=readonly)
+    return Response(json_array_chunks(batches, fields), mimetype='application/json')
@@ -0,0 +1,69 @@
+"""
+Cooperative serving mode for many concurrent or slow clients
+
+Runs the unchanged Flask app on gevent: the standard library and psycopg2
+are patched so that every request handler runs as a greenlet and yields
+to the event loop whenever it waits on a socket, whether that's reading a
+slow client's request, a PostgreSQL query or SMTP. Thousands of open
+connections then cost a greenlet each instead of an OS thread, and a long
+analytics query only parks its own greenlet.
+
+Routes and JSON responses are exactly those of app.py. DB_POOL_MAX still
+caps the number of PostgreSQL connections; requests beyond it wait for a
+connection (up to DB_POOL_TIMEOUT) without holding a thread.
+
+CPU-bound work (image resizing, JSON encoding of very large responses)
+still runs on the single event loop thread, so run one process per core.
+
+Usage:
+    pip install gevent psycogreen
+    python serve_async.py [--host 0.0.0.0] [--port 5000] [--max-clients 5000]
+"""
+from gevent import monkey
+
+# Must run before anything imports socket, ssl, threading or psycopg2
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg
+
+patch_psycopg()
+
+import argparse
+import logging
+import os
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from app import create_app
+from db import close_db_pool
+from email_service import start_outbox_worker, stop_outbox_worker
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default=os.getenv('ASYNC_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('ASYNC_PORT', '5000')))
+    parser.add_argument('--max-clients', type=int, default=int(os.getenv('ASYNC_MAX_CLIENTS', '5000')),
+                        help='concurrent connections served before new ones wait in the accept queue')
+    parser.add_argument('--no-outbox', action='store_true', help="don't run the email outbox worker here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.no_outbox:
+        start_outbox_worker()
+
+    server = WSGIServer((args.host, args.port), create_app(), spawn=Pool(args.max_clients), log=None)
+    logger.info(f"Serving on http://{args.host}:{args.port} (gevent, up to {args.max_clients} connections)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop(timeout=10)
+        stop_outbox_worker()
+        close_db_pool()
+
+
+if __name__ == '__main__':
+    main()
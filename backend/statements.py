@@ -0,0 +1,128 @@
+"""
+Named server-side prepared statements for the hot query set
+
+Each statement is sent to PostgreSQL with PREPARE the first time it is
+used on a pooled connection; after that only EXECUTE name(args) crosses
+the wire, so the server skips parsing and, once it settles on a generic
+plan, planning. Prepared statements live as long as the connection and
+survive ROLLBACK, so the set of names prepared on each connection is
+tracked here, keyed weakly by the connection object: when the pool drops
+or recycles a connection its entry disappears with it.
+
+Statements use $1, $2, ... placeholders; parameter types are inferred by
+the server unless the SQL casts them.
+"""
+import threading
+import weakref
+
+STATEMENTS = {
+    # auth.login
+    'login_user': "SELECT email, password FROM users WHERE LOWER(email) = LOWER($1)",
+    'login_admin': "SELECT email, password FROM admins WHERE LOWER(email) = LOWER($1)",
+
+    # cart
+    'cart_items': "SELECT email, product_id, quantity FROM cart WHERE email = $1",
+    'cart_view': """
+        SELECT c.product_id, p.name, p.price, p.image, p.stock, c.quantity,
+               p.price * c.quantity AS line_total,
+               SUM(p.price * c.quantity) OVER () AS total
+        FROM cart c
+        JOIN products p ON p.id = c.product_id
+        WHERE c.email = $1
+        ORDER BY c.id""",
+    'cart_upsert': """
+        INSERT INTO cart (email, product_id, quantity) VALUES ($1, $2, $3)
+        ON CONFLICT (email, product_id) DO UPDATE
+        SET quantity = cart.quantity + EXCLUDED.quantity""",
+    'cart_remove': "DELETE FROM cart WHERE email = $1 AND product_id = $2",
+    # batch: one statement per kind of change, whatever the number of lines
+    'cart_add_many': """
+        INSERT INTO cart (email, product_id, quantity)
+        SELECT $1, line.product_id, line.quantity
+        FROM unnest($2::int[], $3::int[]) AS line(product_id, quantity)
+        ON CONFLICT (email, product_id) DO UPDATE
+        SET quantity = cart.quantity + EXCLUDED.quantity""",
+    'cart_set_many': """
+        INSERT INTO cart (email, product_id, quantity)
+        SELECT $1, line.product_id, line.quantity
+        FROM unnest($2::int[], $3::int[]) AS line(product_id, quantity)
+        ON CONFLICT (email, product_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity""",
+    'cart_remove_many': "DELETE FROM cart WHERE email = $1 AND product_id = ANY($2::int[])",
+
+    # catalog
+    'catalog_all': "SELECT id AS ID, name, price, stock, image FROM products ORDER BY id",
+    'catalog_page': "SELECT id AS ID, name, price, stock, image FROM products WHERE id > $1 ORDER BY id LIMIT $2",
+
+    # checkout
+    'checkout_lock_cart': """
+        SELECT p.id, p.name, p.price, p.stock, c.quantity
+        FROM cart c
+        JOIN products p ON p.id = c.product_id
+        WHERE c.email = $1
+        ORDER BY p.id
+        FOR UPDATE OF p, c""",
+    # order_id defaults to the next value of order_id_seq (migration 0002)
+    'order_insert': "INSERT INTO orders (email, amount, date) VALUES ($1, $2, $3) RETURNING order_id",
+    'order_items_insert': """
+        INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase)
+        SELECT $1, line.product_id, line.quantity, line.price
+        FROM unnest($2::int[], $3::int[], $4::numeric[]) AS line(product_id, quantity, price)""",
+    'stock_decrement': """
+        UPDATE products p
+        SET stock = p.stock - line.quantity
+        FROM unnest($1::int[], $2::int[]) AS line(product_id, quantity)
+        WHERE p.id = line.product_id AND p.stock >= line.quantity""",
+    'cart_clear': "DELETE FROM cart WHERE email = $1",
+    'outbox_insert': "INSERT INTO email_outbox (recipient, subject, body) VALUES ($1, $2, $3)",
+    'record_order': """
+        WITH daily AS (
+            INSERT INTO daily_sales (date, revenue, order_count)
+            VALUES ($1::date, $2::numeric, 1)
+            ON CONFLICT (date) DO UPDATE
+            SET revenue = daily_sales.revenue + EXCLUDED.revenue,
+                order_count = daily_sales.order_count + 1
+        ), customer AS (
+            INSERT INTO customer_sales (email, order_count, revenue)
+            VALUES ($3, 1, $2::numeric)
+            ON CONFLICT (email) DO UPDATE
+            SET order_count = customer_sales.order_count + 1,
+                revenue = customer_sales.revenue + EXCLUDED.revenue
+        )
+        INSERT INTO product_sales (product_id, quantity_sold, revenue)
+        SELECT line.product_id, line.quantity, line.quantity * line.price
+        FROM unnest($4::int[], $5::int[], $6::numeric[]) AS line(product_id, quantity, price)
+        ON CONFLICT (product_id) DO UPDATE
+        SET quantity_sold = product_sales.quantity_sold + EXCLUDED.quantity_sold,
+            revenue = product_sales.revenue + EXCLUDED.revenue""",
+}
+
+# connection -> names already prepared on it
+_prepared = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def prepare(cursor, name):
+    """PREPARE `name` on the cursor's connection unless it already is"""
+    conn = cursor.connection
+    with _lock:
+        names = _prepared.setdefault(conn, set())
+        if name in names:
+            return
+    # No parameters are passed, so a literal % in the SQL is left alone
+    cursor.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+    with _lock:
+        names.add(name)
+
+
+def execute(cursor, name, params=()):
+    """Run a registered statement by name on the given cursor.
+
+    Results are read from the cursor as usual (fetchone/fetchall/rowcount).
+    """
+    prepare(cursor, name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
@@ -0,0 +1,106 @@
+"""
+Signed session tokens
+
+Login issues a compact token carrying the account email and role, signed
+(HMAC) with SECRET_KEY and timestamped, so checking who is calling needs
+no database query. Verified tokens are kept in a small in-process cache,
+which turns repeat checks of the same token into a dictionary lookup.
+
+Tokens expire after TOKEN_TTL seconds. They are stateless: changing
+SECRET_KEY invalidates every token at once.
+"""
+import logging
+import os
+import secrets
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TTL = int(os.getenv('TOKEN_TTL', str(24 * 3600)))
+
+# token -> (Identity, expires_at)
+verified_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('TOKEN_CACHE_TTL', '300'))
+)
+
+Identity = namedtuple('Identity', ('email', 'role'))
+
+ROLES = ('user', 'admin')
+
+
+def _secret_key():
+    key = os.getenv('SECRET_KEY')
+    if not key:
+        # Tokens then die with the process and differ between processes
+        # that don't share a parent, so set SECRET_KEY outside development
+        logger.warning("SECRET_KEY is not set; using a random key for this process")
+        key = secrets.token_urlsafe(32)
+    return key
+
+
+_serializer = URLSafeTimedSerializer(_secret_key(), salt='session')
+
+
+def issue_token(email, role='user'):
+    """Return a signed token for `email` acting as `role`"""
+    if role not in ROLES:
+        raise ValueError(f"Unknown role: {role}")
+    return _serializer.dumps([email, role])
+
+
+def verify_token(token):
+    """Return the token's Identity, or None when it is forged, malformed or expired"""
+    cached = verified_cache.get(token)
+    if cached is not None:
+        identity, expires_at = cached
+        return identity if time.time() < expires_at else None
+
+    try:
+        (email, role), issued_at = _serializer.loads(token, max_age=TOKEN_TTL, return_timestamp=True)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    identity = Identity(email, role)
+    verified_cache.set(token, (identity, issued_at.timestamp() + TOKEN_TTL))
+    return identity
+
+
+def _claimed_email(kwargs):
+    """The account a request names in its URL or JSON body, if any"""
+    if kwargs.get('email'):
+        return kwargs['email']
+    body = request.get_json(silent=True) if request.is_json else None
+    return body.get('email') if isinstance(body, dict) else None
+
+
+def require_auth(role='user'):
+    """Reject the request unless it carries a valid `Authorization: Bearer` token for `role`.
+
+    The identity is put in ``g.identity``. For user routes, an email given in
+    the URL or body must be the token's own, so nobody can act on another
+    account.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+            identity = verify_token(token.strip()) if scheme.lower() == 'bearer' and token else None
+            if identity is None:
+                response = jsonify({'error': 'Authentication required'})
+                response.headers['WWW-Authenticate'] = 'Bearer'
+                return response, 401
+            if identity.role != role:
+                return jsonify({'error': 'Forbidden'}), 403
+            if role == 'user':
+                claimed = _claimed_email(kwargs)
+                if claimed and claimed.strip().lower() != identity.email.lower():
+                    return jsonify({'error': 'Forbidden'}), 403
+            g.identity = identity
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,114 +1,214 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, g, request, jsonify
 import datetime
-import random
-from email_service import send_email
-from db import get_db_cursor, execute_query
+import psycopg2
+from email_service import queue_order_confirmation, notify_outbox
+from db import PoolTimeout, get_db_cursor, execute_query, record_write_lsn
+import statements
+from catalog import catalog_response, search_response, invalidate_catalog, PRODUCT_CURSOR, PRODUCT_FIELDS
+from pagination import parse_page_args, paginate, set_next_cursor
+from rollups import record_order, invalidate_analytics
+from tokens import require_auth
 
 user_bp = Blueprint('user', __name__)
 
+ORDER_HISTORY_FIELDS = ('order_id', 'date', 'amount', 'items')
+# Order history is ordered by (date, order_id)
+ORDER_HISTORY_CURSOR = (datetime.date, str)
+
+# Most product lines one /cart/batch request may touch
+CART_BATCH_LIMIT = 500
+
 @user_bp.route('/products', methods=['GET'])
 def get_products():
     query = request.args.get('search')
     
     try:
-        with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            if query:
-                cursor.execute(
-                    "SELECT id AS ID, name, price, stock, image FROM products WHERE name ILIKE %s",
-                    (f'%{query}%',)
-                )
-            else:
-                cursor.execute("SELECT id AS ID, name, price, stock, image FROM products")
-            
-            products = cursor.fetchall()
-            # Convert to list of dicts and ensure proper types
-            result = []
-            for row in products:
-                result.append({
-                    'ID': int(row['id']),
-                    'name': row['name'],
-                    'price': float(row['price']),
-                    'stock': int(row['stock']),
-                    'image': row['image']
-                })
-            return jsonify(result)
+        page = parse_page_args(request.args, PRODUCT_FIELDS, PRODUCT_CURSOR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if query:
+            return search_response(query, page.fields)
+        return catalog_response(page)
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
 
 @user_bp.route('/cart', methods=['POST'])
+@require_auth()
 def add_to_cart():
     data = request.json
-    email = data.get('email')
+    # The account comes from the verified token, not from the request body
+    email = g.identity.email
     product_id = data.get('product_id')
     quantity = data.get('quantity', 1)
 
-    if not email or product_id is None:
-        return jsonify({'error': 'Email and product_id are required'}), 400
+    if product_id is None:
+        return jsonify({'error': 'product_id is required'}), 400
+    # Same rule as /cart/batch: a zero or negative line would raise stock at checkout
+    if not _is_int(product_id) or not _is_int(quantity) or quantity < 1:
+        return jsonify({'error': 'product_id and quantity must be integers, quantity >= 1'}), 400
 
     try:
         with get_db_cursor() as (cursor, conn):
-            # Check if item already exists in cart
-            cursor.execute(
-                "SELECT quantity FROM cart WHERE email = %s AND product_id = %s",
-                (email, product_id)
-            )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Update quantity
-                new_quantity = existing[0] + quantity
-                cursor.execute(
-                    "UPDATE cart SET quantity = %s WHERE email = %s AND product_id = %s",
-                    (new_quantity, email, product_id)
-                )
-            else:
-                # Insert new item
-                cursor.execute(
-                    "INSERT INTO cart (email, product_id, quantity) VALUES (%s, %s, %s)",
-                    (email, product_id, quantity)
-                )
+            # Insert or add to the existing line in one atomic statement
+            statements.execute(cursor, 'cart_upsert', (email, product_id, quantity))
             conn.commit()
             return jsonify({'message': 'Added to cart'})
+    except psycopg2.errors.ForeignKeyViolation:
+        # get_db_connection() has already rolled back and returned the connection
+        return jsonify({'error': 'Unknown user or product'}), 404
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+def _read_cart(cursor, email):
+    statements.execute(cursor, 'cart_items', (email,))
+    result = []
+    for row in cursor.fetchall():
+        result.append({
+            'email': row['email'],
+            'product_id': int(row['product_id']),
+            'quantity': int(row['quantity'])
+        })
+    return result
+
 @user_bp.route('/cart/<email>', methods=['GET'])
+@require_auth()
 def get_cart(email):
     try:
         with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            cursor.execute(
-                "SELECT email, product_id, quantity FROM cart WHERE email = %s",
-                (email,)
-            )
-            cart_items = cursor.fetchall()
-            
-            result = []
-            for row in cart_items:
-                result.append({
-                    'email': row['email'],
-                    'product_id': int(row['product_id']),
-                    'quantity': int(row['quantity'])
-                })
-            return jsonify(result)
+            return jsonify(_read_cart(cursor, g.identity.email))
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
 
+def _stock_warning(quantity, stock):
+    if stock <= 0:
+        return 'Out of stock'
+    if quantity > stock:
+        return f'Only {stock} in stock'
+    return None
+
+@user_bp.route('/cart/<email>/view', methods=['GET'])
+@require_auth()
+def get_cart_view(email):
+    """The cart joined with product details, line totals and the grand total, in one query"""
+    try:
+        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+            statements.execute(cursor, 'cart_view', (g.identity.email,))
+            rows = cursor.fetchall()
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+    items = []
+    for row in rows:
+        quantity, stock = int(row['quantity']), int(row['stock'])
+        items.append({
+            'product_id': int(row['product_id']),
+            'name': row['name'],
+            'price': float(row['price']),
+            'image': row['image'],
+            'quantity': quantity,
+            'stock': stock,
+            'line_total': float(row['line_total']),
+            'warning': _stock_warning(quantity, stock)
+        })
+    return jsonify({
+        'items': items,
+        'item_count': sum(item['quantity'] for item in items),
+        'total': float(rows[0]['total']) if rows else 0.0,
+        'can_checkout': bool(items) and not any(item['warning'] for item in items)
+    })
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _parse_cart_lines(lines, key, minimum):
+    """[{'product_id': .., 'quantity': ..}, ...] -> {product_id: quantity}"""
+    if not isinstance(lines, list):
+        raise ValueError(f"'{key}' must be a list")
+    parsed = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ValueError(f"'{key}' entries must be objects with product_id and quantity")
+        product_id = line.get('product_id')
+        quantity = line.get('quantity', 1)
+        if not _is_int(product_id) or not _is_int(quantity) or quantity < minimum:
+            raise ValueError(f"'{key}' needs integer product_id and quantity >= {minimum}")
+        if key == 'add':
+            parsed[product_id] = parsed.get(product_id, 0) + quantity
+        else:
+            parsed[product_id] = quantity
+    return parsed
+
+@user_bp.route('/cart/batch', methods=['POST'])
+@require_auth()
+def update_cart_batch():
+    """Apply many cart changes in one transaction and return the updated cart.
+
+    Body: ``{"remove": [product_id, ...], "set": [{"product_id", "quantity"}, ...],
+    "add": [...]}``; the cart is the token holder's.
+    Removals run first, then ``set`` (absolute quantities, 0 removes the
+    line), then ``add`` (increments). Each kind is a single statement.
+    """
+    data = request.json or {}
+    email = g.identity.email
+
+    try:
+        remove = data.get('remove', [])
+        if not isinstance(remove, list) or not all(_is_int(product_id) for product_id in remove):
+            raise ValueError("'remove' must be a list of product ids")
+        to_set = _parse_cart_lines(data.get('set', []), 'set', 0)
+        to_add = _parse_cart_lines(data.get('add', []), 'add', 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    remove = set(remove) | {product_id for product_id, quantity in to_set.items() if quantity == 0}
+    to_set = {product_id: quantity for product_id, quantity in to_set.items() if quantity > 0}
+    if len(remove) + len(to_set) + len(to_add) > CART_BATCH_LIMIT:
+        return jsonify({'error': f'At most {CART_BATCH_LIMIT} cart lines per request'}), 400
+
+    try:
+        with get_db_cursor(dict_cursor=True) as (cursor, conn):
+            if remove:
+                statements.execute(cursor, 'cart_remove_many', (email, sorted(remove)))
+            # Lines are written in product id order so concurrent batches lock rows consistently
+            if to_set:
+                ids = sorted(to_set)
+                statements.execute(cursor, 'cart_set_many', (email, ids, [to_set[i] for i in ids]))
+            if to_add:
+                ids = sorted(to_add)
+                statements.execute(cursor, 'cart_add_many', (email, ids, [to_add[i] for i in ids]))
+            cart = _read_cart(cursor, email)
+            conn.commit()
+            return jsonify(cart)
+    except psycopg2.errors.ForeignKeyViolation:
+        # get_db_connection() has already rolled back and returned the connection
+        return jsonify({'error': 'Unknown user or product'}), 404
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
 @user_bp.route('/place-order', methods=['POST'])
+@require_auth()
 def place_order():
-    email = request.json.get('email')
-    
-    if not email:
-        return jsonify({'error': 'Email is required'}), 400
+    email = g.identity.email
 
     try:
         with get_db_cursor() as (cursor, conn):
-            # Get user's cart items
-            cursor.execute(
-                "SELECT product_id, quantity FROM cart WHERE email = %s",
-                (email,)
-            )
+            # Lock every product in the cart, and the cart lines themselves, with
+            # one statement. Locking in id order keeps concurrent checkouts from
+            # deadlocking each other; locking the cart lines makes a second
+            # checkout of the same cart wait and then find it empty.
+            statements.execute(cursor, 'checkout_lock_cart', (email,))
             cart_items = cursor.fetchall()
 
             if not cart_items:
@@ -118,18 +218,7 @@ def place_order():
             order_items_data = []
 
             # Validate stock and calculate total
-            for product_id, quantity in cart_items:
-                cursor.execute(
-                    "SELECT id, name, price, stock FROM products WHERE id = %s",
-                    (product_id,)
-                )
-                product = cursor.fetchone()
-
-                if not product:
-                    conn.rollback()
-                    return jsonify({'error': f'Product ID {product_id} not found'}), 400
-
-                prod_id, prod_name, prod_price, prod_stock = product
+            for prod_id, prod_name, prod_price, prod_stock, quantity in cart_items:
                 if quantity > prod_stock:
                     conn.rollback()
                     return jsonify({'error': f'Only {prod_stock} in stock for {prod_name}'}), 400
@@ -138,117 +227,136 @@ def place_order():
                 total += item_total
                 order_items_data.append((prod_id, quantity, prod_price))
 
-            # Generate order ID and date
-            order_id = str(random.randint(10000, 99999))
-            # Ensure unique order_id
-            cursor.execute("SELECT order_id FROM orders WHERE order_id = %s", (order_id,))
-            while cursor.fetchone():
-                order_id = str(random.randint(10000, 99999))
-                cursor.execute("SELECT order_id FROM orders WHERE order_id = %s", (order_id,))
-
             date = datetime.date.today().isoformat()
 
-            # Create order
-            cursor.execute(
-                "INSERT INTO orders (order_id, email, amount, date) VALUES (%s, %s, %s, %s)",
-                (order_id, email, total, date)
-            )
+            # Create order; its ID comes from order_id_seq in the same round trip
+            statements.execute(cursor, 'order_insert', (email, total, date))
+            order_id = cursor.fetchone()[0]
 
-            # Create order items and update stock
-            for prod_id, quantity, price_at_purchase in order_items_data:
-                # Insert order item
-                cursor.execute(
-                    "INSERT INTO order_items (order_id, product_id, quantity, price_at_purchase) VALUES (%s, %s, %s, %s)",
-                    (order_id, prod_id, quantity, price_at_purchase)
-                )
-                
-                # Update product stock
-                cursor.execute(
-                    "UPDATE products SET stock = stock - %s WHERE id = %s",
-                    (quantity, prod_id)
-                )
+            product_ids = [item[0] for item in order_items_data]
+            quantities = [item[1] for item in order_items_data]
+            prices = [item[2] for item in order_items_data]
+
+            # Create all order items in one statement
+            statements.execute(cursor, 'order_items_insert', (order_id, product_ids, quantities, prices))
+
+            # Decrement stock for every line at once. A line that would go
+            # negative is not updated, so a short rowcount aborts the order.
+            statements.execute(cursor, 'stock_decrement', (product_ids, quantities))
+            if cursor.rowcount != len(order_items_data):
+                conn.rollback()
+                return jsonify({'error': 'Some items in your cart are out of stock'}), 409
 
             # Clear user's cart
-            cursor.execute("DELETE FROM cart WHERE email = %s", (email,))
+            statements.execute(cursor, 'cart_clear', (email,))
 
-            conn.commit()
+            # Confirmation mail is queued in the same transaction and sent by the outbox worker
+            queue_order_confirmation(cursor, email, f"Order #{order_id} confirmed.\nTotal: ₹{total:.2f}\nDate: {date}")
 
-            # Send email
-            send_email(email, f"Order #{order_id} confirmed.\nTotal: ₹{total:.2f}\nDate: {date}")
+            # Analytics rollups last: today's daily_sales row is shared by every checkout
+            record_order(cursor, email, date, total, product_ids, quantities, prices)
+
+            conn.commit()
+            record_write_lsn(conn)
+            invalidate_catalog()
+            invalidate_analytics()
+            notify_outbox()
 
             return jsonify({'message': 'Order placed', 'order_id': order_id})
 
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 @user_bp.route('/cart/remove', methods=['POST'])
+@require_auth()
 def remove_from_cart():
     data = request.json
-    email = data.get('email')
+    email = g.identity.email
     product_id = data.get('product_id')
 
-    if not email or product_id is None:
-        return jsonify({'error': 'Email and product_id are required'}), 400
+    if product_id is None:
+        return jsonify({'error': 'product_id is required'}), 400
 
     try:
         with get_db_cursor() as (cursor, conn):
-            cursor.execute(
-                "DELETE FROM cart WHERE email = %s AND product_id = %s",
-                (email, product_id)
-            )
+            statements.execute(cursor, 'cart_remove', (email, product_id))
             conn.commit()
             return jsonify({'message': 'Item removed from cart'})
+    except PoolTimeout:
+        raise
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 @user_bp.route('/orders/<email>', methods=['GET'])
+@require_auth()
 def get_user_orders(email):
+    """Order history, newest first, fetched in a single query.
+
+    Supports keyset pagination (``limit`` / ``after``) and ``summary=1``,
+    which skips the line items entirely.
+    """
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        page = parse_page_args(request.args, ORDER_HISTORY_FIELDS, ORDER_HISTORY_CURSOR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = ["email = %s"]
+    params = [g.identity.email]
+    if page.after:
+        conditions.append("(date, order_id) < (%s, %s)")
+        params.extend(page.after)
+    limit = ""
+    if page.paginated:
+        limit = "LIMIT %s"
+        params.append(page.limit + 1)
+
+    orders_sql = f"""SELECT order_id, date, amount FROM orders
+                     WHERE {' AND '.join(conditions)}
+                     ORDER BY date DESC, order_id DESC {limit}"""
+
     try:
         with get_db_cursor(dict_cursor=True) as (cursor, conn):
-            # Get all orders for the user
-            cursor.execute(
-                "SELECT order_id, email, amount, date FROM orders WHERE email = %s ORDER BY date DESC",
-                (email,)
-            )
+            if summary:
+                cursor.execute(orders_sql, tuple(params))
+            else:
+                # Page of orders first, then its line items aggregated per order
+                cursor.execute(
+                    f"""SELECT o.order_id, o.date, o.amount,
+                               COALESCE(
+                                   json_agg(json_build_object(
+                                       'name', p.name,
+                                       'quantity', oi.quantity,
+                                       'price', oi.quantity * oi.price_at_purchase
+                                   ) ORDER BY oi.id) FILTER (WHERE p.id IS NOT NULL),
+                                   '[]'
+                               ) AS items
+                        FROM ({orders_sql}) o
+                        LEFT JOIN order_items oi ON oi.order_id = o.order_id
+                        LEFT JOIN products p ON p.id = oi.product_id
+                        GROUP BY o.order_id, o.date, o.amount
+                        ORDER BY o.date DESC, o.order_id DESC""",
+                    tuple(params)
+                )
             orders = cursor.fetchall()
 
             result = []
             for order in orders:
-                order_id = order['order_id']
-                date = str(order['date'])
-                amount = float(order['amount'])
-
-                # Get order items from order_items table
-                cursor.execute(
-                    """SELECT oi.quantity, oi.price_at_purchase, p.name 
-                       FROM order_items oi 
-                       JOIN products p ON oi.product_id = p.id 
-                       WHERE oi.order_id = %s""",
-                    (order_id,)
-                )
-                order_items = cursor.fetchall()
-
-                items = []
-                for item in order_items:
-                    quantity = int(item['quantity'])
-                    price_at_purchase = float(item['price_at_purchase'])
-                    items.append({
-                        'name': item['name'],
-                        'quantity': quantity,
-                        'price': price_at_purchase * quantity
-                    })
-
-                result.append({
-                    'order_id': order_id,
-                    'date': date,
-                    'amount': amount,
-                    'items': items
-                })
-
-            return jsonify(result)
+                entry = {
+                    'order_id': order['order_id'],
+                    'date': str(order['date']),
+                    'amount': float(order['amount'])
+                }
+                if not summary:
+                    entry['items'] = order['items']
+                result.append(entry)
+
+            items, next_cursor = paginate(result, page, lambda item: [item['date'], item['order_id']])
+            return set_next_cursor(jsonify(items), next_cursor)
+    except PoolTimeout:
+        raise
     except Exception as e:
         return jsonify([])
@@ -4,4 +4,43 @@ const API = axios.create({
   baseURL: 'http://localhost:5000',  // Flask server
 });
 
+// Signed session tokens from /auth/login: admin routes use the admin's, everything else the user's.
+const tokenKey = (url = '') => (url.startsWith('/admin') ? 'adminToken' : 'token');
+
+API.interceptors.request.use(config => {
+  const token = localStorage.getItem(tokenKey(config.url));
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
+// An expired or rejected token sends the user back to the matching login page
+API.interceptors.response.use(
+  res => res,
+  err => {
+    const url = err.config?.url || '';
+    if (err.response?.status === 401 && !url.startsWith('/auth')) {
+      const admin = url.startsWith('/admin');
+      localStorage.removeItem(tokenKey(url));
+      localStorage.removeItem(admin ? 'admin' : 'user');
+      window.location.assign(admin ? '/admin-login' : '/login');
+    }
+    return Promise.reject(err);
+  }
+);
+
+export const PAGE_SIZE = 50;
+
+// Fetch one keyset page; `next` is the cursor for the following page or null.
+export const fetchPage = (url, params = {}) =>
+  API.get(url, { params: { limit: PAGE_SIZE, ...params } }).then(res => ({
+    items: Array.isArray(res.data) ? res.data : [],
+    next: res.headers['x-next-cursor'] || null,
+  }));
+
+// Resized product image: 'thumb' (160px), 'card' (400px) or 'full' (1200px).
+export const imageUrl = (image, size = 'card') =>
+  `${API.defaults.baseURL}/static/images/${size}/${encodeURIComponent(image)}`;
+
 export default API;
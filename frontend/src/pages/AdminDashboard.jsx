@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import API from '../api';
+import API, { fetchPage, imageUrl } from '../api';
 import AdminAnalytics from '../components/AdminAnalytics';
 import './AdminDashboard.css'; 
 
@@ -9,6 +9,10 @@ function AdminDashboard() {
   const [users, setUsers] = useState([]);
   const [orders, setOrders] = useState([]);
   const [products, setProducts] = useState([]);
+  const [usersNext, setUsersNext] = useState(null);
+  const [ordersNext, setOrdersNext] = useState(null);
+  const [ordersDate, setOrdersDate] = useState(undefined);
+  const [productsNext, setProductsNext] = useState(null);
   const [name, setName] = useState('');
   const [price, setPrice] = useState('');
   const [stock, setStock] = useState('');
@@ -17,10 +21,29 @@ function AdminDashboard() {
   const [deleteId, setDeleteId] = useState('');
   const navigate = useNavigate();
 
+  const loadUsers = (after) =>
+    fetchPage('/admin/users', { fields: 'email', after }).then(({ items, next }) => {
+      setUsers(prev => (after ? [...prev, ...items] : items));
+      setUsersNext(next);
+    });
+
+  const loadOrders = (after, filterDate = ordersDate) =>
+    fetchPage('/admin/orders', { after, date: filterDate }).then(({ items, next }) => {
+      setOrders(prev => (after ? [...prev, ...items] : items));
+      setOrdersNext(next);
+      setOrdersDate(filterDate);
+    });
+
+  const loadProducts = (after) =>
+    fetchPage('/admin/products', { after }).then(({ items, next }) => {
+      setProducts(prev => (after ? [...prev, ...items] : items));
+      setProductsNext(next);
+    });
+
   useEffect(() => {
-    API.get('/admin/users').then(res => setUsers(res.data));
-    API.get('/admin/orders').then(res => setOrders(res.data));
-    API.get('/admin/products').then(res => setProducts(res.data));
+    loadUsers();
+    loadOrders();
+    loadProducts();
   }, []);
 
   const addProduct = () => {
@@ -44,9 +67,8 @@ function AdminDashboard() {
         setPrice('');
         setStock('');
         setImage(null);
-        return API.get('/admin/products');
+        return loadProducts();
       })
-      .then(res => setProducts(res.data))
       .catch(() => alert('Error adding product'));
   };
 
@@ -60,9 +82,8 @@ function AdminDashboard() {
       .then(() => {
         alert('Product removed');
         setDeleteId('');
-        return API.get('/admin/products');
+        return loadProducts();
       })
-      .then(res => setProducts(res.data))
       .catch(() => alert('Error deleting product'));
   };
 
@@ -71,13 +92,12 @@ function AdminDashboard() {
       alert('Please enter a date to filter');
       return;
     }
-    API.get(`/admin/orders?date=${date}`).then(res => {
-      setOrders(res.data);
-      setDate('');
-    });
+    loadOrders(undefined, date).then(() => setDate(''));
   };
 
   const logout = () => {
+    localStorage.removeItem('admin');
+    localStorage.removeItem('adminToken');
     navigate('/');
   };
 
@@ -179,8 +199,9 @@ function AdminDashboard() {
                   <td>
                     {p.image ? (
                       <img
-                        src={p.image}
+                        src={imageUrl(p.image, 'thumb')}
                         alt={p.name}
+                        loading="lazy"
                         className="product-image"
                       />
                     ) : (
@@ -192,6 +213,7 @@ function AdminDashboard() {
             </tbody>
           </table>
         )}
+        {productsNext && <button onClick={() => loadProducts(productsNext)}>Load more</button>}
       </section>
 
       <section>
@@ -232,6 +254,7 @@ function AdminDashboard() {
             </tbody>
           </table>
         )}
+        {ordersNext && <button onClick={() => loadOrders(ordersNext)}>Load more</button>}
       </section>
 
       <section>
@@ -254,6 +277,7 @@ function AdminDashboard() {
             </tbody>
           </table>
         )}
+        {usersNext && <button onClick={() => loadUsers(usersNext)}>Load more</button>}
         </section>
         </div>
       )}
@@ -10,8 +10,9 @@ function AdminLogin() {
 
   const handleAdminLogin = async () => {
     try {
-      await API.post('/auth/login', { email, password, admin: true });
-      localStorage.setItem('admin', email);
+      const res = await API.post('/auth/login', { email, password, admin: true });
+      localStorage.setItem('admin', res.data.email);
+      localStorage.setItem('adminToken', res.data.token);
       navigate('/admin-dashboard');
     } catch (err) {
       alert('Invalid admin credentials');
@@ -10,8 +10,9 @@ function Login() {
 
   const handleLogin = async () => {
     try {
-      await API.post('/auth/login', { email, password });
-      localStorage.setItem('user', email);
+      const res = await API.post('/auth/login', { email, password });
+      localStorage.setItem('user', res.data.email);
+      localStorage.setItem('token', res.data.token);
       navigate('/dashboard');
     } catch (err) {
       alert('Invalid credentials');
@@ -1,31 +1,52 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import API from '../api';
+import API, { fetchPage, imageUrl } from '../api';
 import OrderSummary from './OrderSummary';
 import './UserDashboard.css';
 
 function UserDashboard() {
-  const [allProducts, setAllProducts] = useState([]);
+  const [products, setProducts] = useState([]);
+  const [productsNext, setProductsNext] = useState(null);
   const [search, setSearch] = useState('');
   const [quantities, setQuantities] = useState({});
   const [cart, setCart] = useState([]);
+  const [cartTotal, setCartTotal] = useState(0);
   const [showCart, setShowCart] = useState(false);
   const [orderDetails, setOrderDetails] = useState(null);
   const email = localStorage.getItem('user');
   const navigate = useNavigate();
 
-  useEffect(() => {
-    API.get('/user/products')
-      .then(res => {
-        setAllProducts(Array.isArray(res.data) ? res.data : []);
+  // Only the latest request may update the grid, so a slow response to an
+  // earlier search can't overwrite a newer one.
+  const latestRequest = useRef(0);
+
+  // One catalog page at a time; a search is ranked on the server and comes
+  // back in one bounded response with no next page.
+  const loadProducts = (after, query = search.trim()) => {
+    const request = ++latestRequest.current;
+    const params = query ? { search: query } : { after };
+    return fetchPage('/user/products', params)
+      .then(({ items, next }) => {
+        if (request !== latestRequest.current) return;
+        setProducts(prev => (after ? [...prev, ...items] : items));
+        setProductsNext(query ? null : next);
       })
       .catch(() => {
-        setAllProducts([]);
+        if (request !== latestRequest.current) return;
+        setProducts([]);
+        setProductsNext(null);
       });
-  }, []);
+  };
+
+  useEffect(() => {
+    // Wait for a pause in typing before searching
+    const timer = setTimeout(() => loadProducts(), search ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [search]);
 
   const handleLogout = () => {
     localStorage.removeItem('user');
+    localStorage.removeItem('token');
     navigate('/');
   };
 
@@ -42,8 +63,10 @@ function UserDashboard() {
   };
 
   const loadCart = () => {
-    API.get(`/user/cart/${email}`).then(res => {
-      setCart(res.data);
+    // Product details and totals come joined from the server
+    API.get(`/user/cart/${email}/view`).then(res => {
+      setCart(res.data.items);
+      setCartTotal(res.data.total);
       setShowCart(true);
     });
   };
@@ -55,22 +78,17 @@ function UserDashboard() {
         const orderSummaryData = {
           order_id: res.data.order_id,
           date: new Date().toLocaleString(),
-          items: cart.map(item => {
-            const product = allProducts.find(p => p.ID === item.product_id);
-            return {
-              name: product?.name || 'Unknown Product',
-              quantity: item.quantity,
-              price: (product?.price || 0) * item.quantity,
-              image: product?.image || null,
-            };
-          }),
-          total_price: cart.reduce((acc, item) => {
-            const product = allProducts.find(p => p.ID === item.product_id);
-            return acc + (product ? product.price * item.quantity : 0);
-          }, 0)
+          items: cart.map(item => ({
+            name: item.name,
+            quantity: item.quantity,
+            price: item.line_total,
+            image: item.image,
+          })),
+          total_price: cartTotal
         };
         setOrderDetails(orderSummaryData);
         setCart([]);
+        setCartTotal(0);
         setShowCart(false);
       })
       .catch(err => {
@@ -82,16 +100,6 @@ function UserDashboard() {
     API.post('/user/cart/remove', { email, product_id }).then(() => loadCart());
   };
 
-  const getProductById = (productId) => {
-    return allProducts.find(p => p.ID === parseInt(productId));
-  };
-
-  const filteredProducts = Array.isArray(allProducts)
-    ? allProducts.filter(p =>
-        p.name.toLowerCase().includes(search.toLowerCase())
-      )
-    : [];
-
   const backToDashboard = () => setOrderDetails(null);
 
   const fallbackImage = 'https://via.placeholder.com/180?text=No+Image';
@@ -120,15 +128,17 @@ function UserDashboard() {
 
       {!showCart && (
         <div className="products-grid">
-          {filteredProducts.length === 0 ? (
+          {products.length === 0 ? (
             <p>No products found.</p>
           ) : (
-            filteredProducts.map(p => (
+            products.map(p => (
               <div className="product-card" key={p.ID}>
                 <img
                   className="product-image"
-                  src={p.image ? `http://localhost:5000/static/images/${p.image}` : fallbackImage}
+                  src={p.image ? imageUrl(p.image, 'card') : fallbackImage}
                   alt={p.name}
+                  loading="lazy"
+                  decoding="async"
                 />
                 <div className="product-name">{p.name}</div>
                 <div className="product-price-stock">₹{p.price} | Stock: {p.stock}</div>
@@ -148,6 +158,12 @@ function UserDashboard() {
         </div>
       )}
 
+      {!showCart && productsNext && (
+        <center>
+          <button onClick={() => loadProducts(productsNext)}>Load more</button>
+        </center>
+      )}
+
       {showCart && (
         <div className="cart-container">
           <h3>Your Cart</h3>
@@ -157,23 +173,23 @@ function UserDashboard() {
             </center>
           ) : (
             <ul className="cart-list">
-              {cart.map((item, i) => {
-                const product = getProductById(item.product_id);
-                return (
-                  <li key={i} className="cart-item">
-                    <img
-                      src={product?.image ? `http://localhost:5000/static/images/${product.image}` : fallbackImage}
-                      alt={product?.name || 'Unknown Product'}
-                    />
-                    <span className="cart-item-info">
-                      {product?.name || 'Unknown Product'} — Quantity: {item.quantity}
-                    </span>
-                    <button onClick={() => removeFromCart(item.product_id)}>Remove</button>
-                  </li>
-                );
-              })}
+              {cart.map(item => (
+                <li key={item.product_id} className="cart-item">
+                  <img
+                    src={item.image ? imageUrl(item.image, 'thumb') : fallbackImage}
+                    alt={item.name}
+                    loading="lazy"
+                  />
+                  <span className="cart-item-info">
+                    {item.name} — Quantity: {item.quantity} — ₹{item.line_total.toFixed(2)}
+                    {item.warning && <em> ({item.warning})</em>}
+                  </span>
+                  <button onClick={() => removeFromCart(item.product_id)}>Remove</button>
+                </li>
+              ))}
             </ul>
           )}
+          {cart.length > 0 && <p><strong>Total: ₹{cartTotal.toFixed(2)}</strong></p>}
           <div className="cart-buttons">
             <button onClick={confirmOrder}>Confirm Order</button>
             <button onClick={() => setShowCart(false)}>Back to Dashboard</button>
@@ -1,17 +1,25 @@
 import React, { useEffect, useState } from 'react';
-import API from '../api';
+import { fetchPage } from '../api';
 import { useNavigate } from 'react-router-dom';
 import './UserOrders.css';
 
 function UserOrders() {
   const [orders, setOrders] = useState([]);
+  const [next, setNext] = useState(null);
   const email = localStorage.getItem('user');
   const navigate = useNavigate();
 
-  useEffect(() => {
-    API.get(`/user/orders/${email}`)
-      .then(res => setOrders(res.data))
+  // Only the order header is rendered here, so skip the line items
+  const loadOrders = (after) =>
+    fetchPage(`/user/orders/${email}`, { summary: 1, after })
+      .then(({ items, next }) => {
+        setOrders(prev => (after ? [...prev, ...items] : items));
+        setNext(next);
+      })
       .catch(() => alert('Failed to fetch orders.'));
+
+  useEffect(() => {
+    loadOrders();
   }, [email]);
 
   return (
@@ -37,6 +45,7 @@ function UserOrders() {
           ))}
         </ul>
       )}
+      {next && <button className="back-button" onClick={() => loadOrders(next)}>Load more</button>}
       <button className="back-button" onClick={() => navigate('/dashboard')}>Back to Dashboard</button>
     </div>
   );